@@ -0,0 +1,64 @@
+"""
+Measure the latency the audit log adds to /auth/verify
+
+Runs the app in-process (ASGI transport, no network) and compares
+/auth/verify with the event log disabled vs enabled (JSONL sink).
+
+    python -m benchmarks.audit_overhead [requests]
+"""
+
+import asyncio
+import statistics
+import sys
+import tempfile
+import time
+
+import httpx
+
+from src.events import EventLog, JSONLSink
+from src.main import app, jwt_manager
+from src import main as app_module
+from src.models import UserInfo
+
+
+async def run(requests: int, event_log: EventLog) -> list:
+    app_module.event_log = event_log
+    await event_log.start()
+    token = jwt_manager.create_access_token(
+        UserInfo(email="bench@comma.cm", name="Bench", domain="comma.cm", provider="google")
+    )
+    headers = {"Authorization": f"Bearer {token}"}
+    timings = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for _ in range(200):
+            await client.post("/auth/verify", headers=headers)
+        for _ in range(requests):
+            started = time.perf_counter()
+            response = await client.post("/auth/verify", headers=headers)
+            timings.append((time.perf_counter() - started) * 1e6)
+            assert response.json()["valid"]
+    await event_log.stop()
+    return timings
+
+
+def report(label: str, timings: list):
+    timings = sorted(timings)
+    p50 = statistics.median(timings)
+    p99 = timings[int(len(timings) * 0.99) - 1]
+    print(f"{label:<12} p50={p50:8.1f}us  p99={p99:8.1f}us  mean={statistics.fmean(timings):8.1f}us")
+
+
+async def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    baseline = await run(requests, EventLog(sink=None))
+    with tempfile.TemporaryDirectory() as tmp:
+        audited_log = EventLog(sink=JSONLSink(f"{tmp}/audit.jsonl"), flush_interval=0.05)
+        audited = await run(requests, audited_log)
+    report("no audit", baseline)
+    report("audit jsonl", audited)
+    print(f"delta p50={statistics.median(audited) - statistics.median(baseline):+.1f}us  "
+          f"written={audited_log.written} dropped={audited_log.dropped}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,63 @@
+"""
+Directory-scope lookup latency and cache hit rate against the fake directory
+
+Starts benchmarks.fake_directory on a local port, then compares per-user
+lookups (TTL cache, cold) with lookups served from the background index.
+
+    python -m benchmarks.directory_lookup
+"""
+
+import asyncio
+import random
+import threading
+import time
+
+import uvicorn
+
+from src.config import settings
+
+PORT = 8089
+
+
+def start_fake_directory():
+    server = uvicorn.Server(uvicorn.Config("benchmarks.fake_directory:app", port=PORT, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+
+async def timed_lookups(directory, emails) -> float:
+    started = time.perf_counter()
+    for email in emails:
+        await directory.scopes_for(email, fallback=[])
+    return (time.perf_counter() - started) / len(emails) * 1000
+
+
+async def main():
+    settings.GOOGLE_DIRECTORY_URL = f"http://127.0.0.1:{PORT}/admin/directory/v1"
+    settings.GOOGLE_DIRECTORY_CREDENTIALS_FILE = ""
+    settings.DIRECTORY_SCOPE_RULES = {
+        "group:admins@comma.cm": ["read", "write", "admin"],
+        "orgunit:/Staff": ["read", "write"],
+    }
+    from src.auth.google_directory import GoogleDirectory
+
+    start_fake_directory()
+    random.seed(0)
+    # 50 active users, some unknown, 500 logins
+    emails = [f"user{i}@comma.cm" for i in random.sample(range(1000), 45)] + [f"ghost{i}@comma.cm" for i in range(5)]
+    workload = [random.choice(emails) for _ in range(500)]
+
+    directory = GoogleDirectory()
+    per_user_ms = await timed_lookups(directory, workload)
+    print(f"per-user cache   avg={per_user_ms:8.3f}ms/lookup  {directory.snapshot()}")
+
+    directory = GoogleDirectory()
+    await directory.refresh_index()
+    indexed_ms = await timed_lookups(directory, workload)
+    print(f"index refresh    {directory.last_refresh_ms:.1f}ms for the whole org")
+    print(f"indexed          avg={indexed_ms:8.3f}ms/lookup  {directory.snapshot()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,85 @@
+"""
+Local fake of the Google Admin SDK Directory API (the endpoints google_directory.py uses)
+
+Serves a generated org with configurable size and latency, so directory-backed
+scopes can be exercised without a Workspace tenant:
+
+    FAKE_DIRECTORY_USERS=5000 FAKE_DIRECTORY_LATENCY_MS=80 \\
+        uvicorn benchmarks.fake_directory:app --port 8089
+    GOOGLE_DIRECTORY_URL=http://localhost:8089/admin/directory/v1 \\
+        DIRECTORY_SCOPE_RULES='{"group:admins@comma.cm": ["read", "write", "admin"]}' ...
+"""
+
+import asyncio
+import os
+from collections import Counter
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, HTTPException
+
+USERS = int(os.getenv("FAKE_DIRECTORY_USERS", "1000"))
+LATENCY = float(os.getenv("FAKE_DIRECTORY_LATENCY_MS", "50")) / 1000
+DOMAIN = os.getenv("FAKE_DIRECTORY_DOMAIN", "comma.cm")
+
+# user{i}: every 10th is in admins, every 3rd in staff; every 4th lives under /Staff/Engineering
+users: Dict[str, str] = {
+    f"user{i}@{DOMAIN}": "/Staff/Engineering" if i % 4 == 0 else "/Contractors"
+    for i in range(USERS)
+}
+groups: Dict[str, List[str]] = {
+    f"admins@{DOMAIN}": [email for i, email in enumerate(users) if i % 10 == 0],
+    f"staff@{DOMAIN}": [email for i, email in enumerate(users) if i % 3 == 0],
+}
+requests_served: Counter = Counter()
+
+app = FastAPI(title="Fake Google Directory")
+
+
+def page(items: List[Dict], key: str, page_token: Optional[str], max_results: int) -> Dict:
+    start = int(page_token or 0)
+    body = {key: items[start:start + max_results]}
+    if start + max_results < len(items):
+        body["nextPageToken"] = str(start + max_results)
+    return body
+
+
+@app.get("/admin/directory/v1/groups")
+async def list_groups(userKey: str, pageToken: Optional[str] = None, maxResults: int = 200):
+    await asyncio.sleep(LATENCY)
+    requests_served["groups.list"] += 1
+    if userKey.lower() not in users:
+        raise HTTPException(status_code=404, detail="Resource Not Found: userKey")
+    items = [{"email": group} for group, members in groups.items() if userKey.lower() in members]
+    return page(items, "groups", pageToken, maxResults)
+
+
+@app.get("/admin/directory/v1/groups/{group_key}/members")
+async def list_members(group_key: str, pageToken: Optional[str] = None, maxResults: int = 200):
+    await asyncio.sleep(LATENCY)
+    requests_served["members.list"] += 1
+    if group_key.lower() not in groups:
+        raise HTTPException(status_code=404, detail="Resource Not Found: groupKey")
+    items = [{"email": email, "type": "USER"} for email in groups[group_key.lower()]]
+    return page(items, "members", pageToken, maxResults)
+
+
+@app.get("/admin/directory/v1/users")
+async def list_users(customer: str = "my_customer", pageToken: Optional[str] = None, maxResults: int = 200):
+    await asyncio.sleep(LATENCY)
+    requests_served["users.list"] += 1
+    items = [{"primaryEmail": email, "orgUnitPath": path} for email, path in users.items()]
+    return page(items, "users", pageToken, maxResults)
+
+
+@app.get("/admin/directory/v1/users/{user_key}")
+async def get_user(user_key: str):
+    await asyncio.sleep(LATENCY)
+    requests_served["users.get"] += 1
+    if user_key.lower() not in users:
+        raise HTTPException(status_code=404, detail="Resource Not Found: userKey")
+    return {"primaryEmail": user_key.lower(), "orgUnitPath": users[user_key.lower()]}
+
+
+@app.get("/stats")
+async def stats():
+    return dict(requests_served)
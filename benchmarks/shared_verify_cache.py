@@ -0,0 +1,74 @@
+"""
+Hit rate and throughput of JWTManager.verify_token across worker processes
+
+Splits a fixed workload (random picks from a pool of live session tokens)
+across 1, 4 and 16 processes and compares no cache, a per-process cache
+(each worker its own table, as with in-process caching) and one table
+shared by every worker.
+
+    python -m benchmarks.shared_verify_cache [total_verifications] [sessions]
+"""
+
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+from src.config import settings
+
+
+def worker(mode: str, cache_path: str, tokens, picks):
+    if mode == "shared":
+        settings.SHARED_VERIFY_CACHE_PATH = cache_path
+    elif mode == "per-process":
+        settings.SHARED_VERIFY_CACHE_PATH = f"{cache_path}.{os.getpid()}"
+    else:
+        settings.SHARED_VERIFY_CACHE_PATH = ""
+    from src.auth.jwt_manager import JWTManager
+
+    manager = JWTManager()
+    for index in picks:
+        assert manager.verify_token(tokens[index]).valid
+    cache = manager.verify_cache
+    return (cache.hits, cache.misses) if cache else (0, len(picks))
+
+
+def run(mode: str, workers: int, tokens, total: int):
+    rng = random.Random(workers)
+    picks = [rng.randrange(len(tokens)) for _ in range(total)]
+    chunks = [picks[i::workers] for i in range(workers)]
+    with tempfile.TemporaryDirectory(dir="/dev/shm" if os.path.isdir("/dev/shm") else None) as tmp:
+        cache_path = os.path.join(tmp, "verify.cache")
+        with multiprocessing.get_context("fork").Pool(workers) as pool:
+            started = time.perf_counter()
+            results = pool.starmap(worker, [(mode, cache_path, tokens, chunk) for chunk in chunks])
+            elapsed = time.perf_counter() - started
+    hits = sum(h for h, _ in results)
+    misses = sum(m for _, m in results)
+    print(f"workers={workers:<3} {mode:<12} {total / elapsed:10,.0f} verifications/s  hit_rate={hits / (hits + misses):.3f}")
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 40000
+    sessions = int(sys.argv[2]) if len(sys.argv) > 2 else 4000
+    from src.auth.jwt_manager import JWTManager
+    from src.models import UserInfo
+
+    manager = JWTManager()
+    tokens = [
+        manager.create_access_token(
+            UserInfo(email=f"user{i}@comma.cm", name=f"User {i}", domain="comma.cm", provider="google"),
+            scopes=["read", "write"]
+        )
+        for i in range(sessions)
+    ]
+    print(f"{total} verifications over {sessions} session tokens, {os.cpu_count()} CPU(s)")
+    for workers in (1, 4, 16):
+        for mode in ("none", "per-process", "shared"):
+            run(mode, workers, tokens, total)
+
+
+if __name__ == "__main__":
+    main()
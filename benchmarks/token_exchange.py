@@ -0,0 +1,45 @@
+"""
+Throughput of JWTManager.exchange_token on cache hits vs misses
+
+    python -m benchmarks.token_exchange [iterations]
+"""
+
+import sys
+import time
+
+from src.auth.jwt_manager import ExchangedTokenCache, JWTManager
+from src.models import UserInfo
+
+
+def bench(label: str, fn, iterations: int):
+    started = time.perf_counter()
+    for i in range(iterations):
+        fn(i)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<10} {iterations / elapsed:12,.0f} exchanges/s  {elapsed / iterations * 1e6:8.2f}us/op")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    manager = JWTManager()
+    subject_token = manager.create_2fa_token(
+        UserInfo(email="bench@comma.cm", name="Bench", domain="comma.cm", provider="google"),
+        scopes=["read", "write", "admin"]
+    )
+
+    def miss(i):
+        # A cache that never retains anything forces verify + sign every time
+        manager.exchange_cache = ExchangedTokenCache(max_entries=0)
+        manager.exchange_token(subject_token, "comma-api", ["read"])
+
+    def hit(i):
+        manager.exchange_token(subject_token, "comma-api", ["read"])
+
+    bench("miss", miss, iterations)
+    manager.exchange_cache = ExchangedTokenCache()
+    bench("hit", hit, iterations)
+    print(manager.exchange_cache.snapshot())
+
+
+if __name__ == "__main__":
+    main()
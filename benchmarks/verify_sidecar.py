@@ -0,0 +1,118 @@
+"""
+/auth/verify over HTTP vs the Unix-socket sidecar
+
+Starts the app under uvicorn in a subprocess with VERIFY_SOCKET_PATH set,
+then measures calls/s and latency percentiles for: HTTP keep-alive on
+loopback, the socket one request at a time, and the socket with pipelined
+batches.
+
+    python -m benchmarks.verify_sidecar [calls] [pipeline_depth]
+"""
+
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from src.auth.jwt_manager import JWTManager
+from src.models import UserInfo
+from src.sidecar import LENGTH, REQUEST_HEADER, RESPONSE_HEADER, STATUS_VALID
+
+PORT = 8091
+
+
+def start_server(tmp: str, socket_path: str) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        VERIFY_SOCKET_PATH=socket_path,
+        AUDIT_LOG_PATH=f"{tmp}/audit.jsonl",
+        TOTP_STORE_PATH=f"{tmp}/totp.db"
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.main:app", "--port", str(PORT), "--log-level", "warning"],
+        env=env
+    )
+    deadline = time.monotonic() + 15
+    while not os.path.exists(socket_path):
+        if time.monotonic() > deadline or server.poll() is not None:
+            server.kill()
+            raise RuntimeError("server did not start")
+        time.sleep(0.05)
+    return server
+
+
+def frame(request_id: int, token: bytes) -> bytes:
+    audience = b"comma-apps"
+    return LENGTH.pack(REQUEST_HEADER.size + len(audience) + len(token)) + \
+        REQUEST_HEADER.pack(request_id, len(audience)) + audience + token
+
+
+def read_response(reader) -> int:
+    length, _, status, _, _ = RESPONSE_HEADER.unpack(reader.read(RESPONSE_HEADER.size))
+    reader.read(length + LENGTH.size - RESPONSE_HEADER.size)
+    return status
+
+
+def bench_http(token: str, calls: int):
+    timings = []
+    with httpx.Client(base_url=f"http://127.0.0.1:{PORT}", headers={"Authorization": f"Bearer {token}"}) as client:
+        for _ in range(calls):
+            started = time.perf_counter()
+            response = client.post("/auth/verify")
+            timings.append(time.perf_counter() - started)
+            assert response.json()["valid"]
+    return timings, calls
+
+
+def bench_socket(path: str, token: str, calls: int, depth: int):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path)
+    reader = sock.makefile("rb")
+    batch = b"".join(frame(i, token.encode()) for i in range(depth))
+    timings = []
+    for _ in range(calls // depth):
+        started = time.perf_counter()
+        sock.sendall(batch)
+        for _ in range(depth):
+            assert read_response(reader) == STATUS_VALID
+        timings.append(time.perf_counter() - started)
+    sock.close()
+    return timings, (calls // depth) * depth
+
+
+def report(label: str, timings, calls: int):
+    timings = sorted(timings)
+    p50 = statistics.median(timings) * 1e6
+    p99 = timings[int(len(timings) * 0.99) - 1] * 1e6
+    print(f"{label:<22} {calls / sum(timings):10,.0f} calls/s  p50={p50:8.1f}us  p99={p99:8.1f}us")
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    depth = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    token = JWTManager().create_access_token(
+        UserInfo(email="bench@comma.cm", name="Bench", domain="comma.cm", provider="google"),
+        scopes=["read", "write"]
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        socket_path = f"{tmp}/verify.sock"
+        server = start_server(tmp, socket_path)
+        try:
+            bench_http(token, 500)
+            bench_socket(socket_path, token, 500, 1)
+            report("http keep-alive", *bench_http(token, calls))
+            report("socket", *bench_socket(socket_path, token, calls, 1))
+            # Latency here is per batch of `depth` calls
+            report(f"socket pipelined x{depth}", *bench_socket(socket_path, token, calls, depth))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
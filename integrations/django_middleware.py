@@ -5,18 +5,121 @@ Copy this to each CMYK Django project
 
 import httpx
 import json
+import queue
+import socket
+import struct
+from datetime import datetime
 from django.conf import settings
 from django.contrib.auth import login
 from django.contrib.auth.models import User
 from django.http import JsonResponse
 from django.utils.deprecation import MiddlewareMixin
-from typing import Optional
+from typing import List, Optional
+
+class CommaAuthSocketClient:
+    """
+    Pooled client for comma-auth's Unix-socket verification sidecar
+    (VERIFY_SOCKET_PATH on the auth host; protocol in comma-auth src/sidecar.py).
+    Thread-safe: each call borrows one connection from the pool.
+    """
+    
+    REQUEST = struct.Struct('<IIB')  # length, id, audience length
+    RESPONSE = struct.Struct('<IIBBI')  # length, id, status, flags, exp
+    STATUS_INVALID = 0
+    STATUS_VALID = 1
+    FLAG_REQUIRES_2FA = 1
+    
+    def __init__(self, path: str, pool_size: int = 8, timeout: float = 1.0):
+        self.path = path
+        self.timeout = timeout
+        self._pool: queue.LifoQueue = queue.LifoQueue()
+        for _ in range(pool_size):
+            self._pool.put(None)  # connected lazily
+    
+    def verify(self, token: str, audience: str = 'comma-apps') -> dict:
+        return self.verify_many([token], audience)[0]
+    
+    def verify_many(self, tokens: List[str], audience: str = 'comma-apps') -> List[dict]:
+        """Pipeline every token in one write; raises if the sidecar is unreachable or misbehaves"""
+        try:
+            conn = self._pool.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError('no free comma-auth sidecar connection')
+        healthy = False
+        try:
+            if conn is None:
+                conn = self._connect()
+            sock, reader = conn
+            audience_bytes = audience.encode()
+            frames = bytearray()
+            for request_id, token in enumerate(tokens):
+                token_bytes = token.encode()
+                frames += self.REQUEST.pack(5 + len(audience_bytes) + len(token_bytes), request_id, len(audience_bytes))
+                frames += audience_bytes + token_bytes
+            sock.sendall(frames)
+            results = [self._read_response(reader) for _ in tokens]
+            healthy = True
+            return results
+        finally:
+            # Always give the slot back; a connection in an unknown state is dropped, not reused
+            if not healthy and conn is not None:
+                conn[1].close()
+                conn[0].close()
+            self._pool.put(conn if healthy else None)
+    
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+            return sock, sock.makefile('rb')
+        except OSError:
+            sock.close()
+            raise
+    
+    def _read_response(self, reader) -> dict:
+        header = reader.read(self.RESPONSE.size)
+        if len(header) < self.RESPONSE.size:
+            raise ConnectionError('comma-auth sidecar closed the connection')
+        length, _, status, flags, exp = self.RESPONSE.unpack(header)
+        body = reader.read(length + 4 - self.RESPONSE.size)
+        if status == self.STATUS_INVALID:
+            return {'valid': False}
+        if status != self.STATUS_VALID:
+            # e.g. STATUS_BAD_REQUEST: a framing problem, not a verdict on the token
+            raise ValueError(f'comma-auth sidecar answered status {status}')
+        
+        fields = []
+        offset = 0
+        for _ in range(6):
+            (size,) = struct.unpack_from('<H', body, offset)
+            fields.append(body[offset + 2:offset + 2 + size].decode())
+            offset += 2 + size
+        email, name, picture, domain, provider, scopes = fields
+        # Same shape as the JSON returned by POST /auth/verify
+        return {
+            'valid': True,
+            'user_info': {
+                'email': email,
+                'name': name,
+                'picture': picture or None,
+                'domain': domain,
+                'provider': provider,
+            },
+            'scopes': scopes.split(),
+            'expires_at': datetime.utcfromtimestamp(exp).isoformat() if exp else None,
+            'requires_2fa': bool(flags & self.FLAG_REQUIRES_2FA),
+        }
+
 
 class CommaAuthMiddleware(MiddlewareMixin):
     def __init__(self, get_response):
         self.get_response = get_response
         self.comma_auth_url = getattr(settings, 'COMMA_AUTH_URL', 'http://localhost:8000')
         self.comma_auth_enabled = getattr(settings, 'COMMA_AUTH_ENABLED', True)
+        # Set COMMA_AUTH_SOCKET when comma-auth runs on the same host; HTTP stays the fallback
+        socket_path = getattr(settings, 'COMMA_AUTH_SOCKET', '')
+        self.socket_client = CommaAuthSocketClient(socket_path) if socket_path else None
         super().__init__(get_response)
     
     def process_request(self, request):
@@ -54,6 +157,13 @@ class CommaAuthMiddleware(MiddlewareMixin):
     
     def _verify_token(self, token: str) -> Optional[dict]:
         """Verify token with comma auth service"""
+        if self.socket_client is not None:
+            try:
+                data = self.socket_client.verify(token)
+                return data.get('user_info') if data.get('valid') else None
+            except Exception:
+                pass  # sidecar down, restarting or misbehaving; use HTTP
+        
         try:
             headers = {'Authorization': f'Bearer {token}'}
             response = httpx.post(
@@ -10,6 +10,9 @@ COMMA_AUTH_URL = "https://auth.comma.cm"  # Production URL
 # For development
 # COMMA_AUTH_URL = "http://localhost:8000"
 
+# When comma-auth runs on the same host (its VERIFY_SOCKET_PATH); falls back to COMMA_AUTH_URL
+# COMMA_AUTH_SOCKET = "/run/comma-auth/verify.sock"
+
 # Add to MIDDLEWARE (preferably after AuthenticationMiddleware)
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
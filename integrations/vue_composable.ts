@@ -70,6 +70,33 @@ export function useCommaAuth(config?: CommaAuthConfig) {
     }
   }
 
+  // Reuse an existing SSO session (set by auth.comma.cm for the parent domain)
+  // to get tokens without redirecting through Google or sending another OTP
+  async function trySessionLogin() {
+    try {
+      const response = await fetch(`${authUrl.value}/auth/session/token`, {
+        method: 'POST',
+        credentials: 'include',
+      })
+
+      if (!response.ok) return false
+
+      const data: TokenResponse = await response.json()
+      accessToken.value = data.access_token
+      refreshToken.value = data.refresh_token
+      requires2FA.value = data.requires_2fa
+
+      localStorage.setItem('comma_access_token', data.access_token)
+      localStorage.setItem('comma_refresh_token', data.refresh_token)
+
+      await verifyToken()
+      return true
+    } catch (error) {
+      console.error('Session login failed:', error)
+      return false
+    }
+  }
+
   async function handleAuthCallback(token: string, requires2fa?: boolean) {
     accessToken.value = token
     requires2FA.value = requires2fa || false
@@ -107,12 +134,12 @@ export function useCommaAuth(config?: CommaAuthConfig) {
         }
       }
       
-      // Token invalid, clear auth
-      logout()
+      // Token invalid, clear auth (the SSO session may still recover it)
+      clearLocalAuth()
       return false
     } catch (error) {
       console.error('Token verification failed:', error)
-      logout()
+      clearLocalAuth()
       return false
     }
   }
@@ -147,6 +174,7 @@ export function useCommaAuth(config?: CommaAuthConfig) {
     try {
       const response = await fetch(`${authUrl.value}/auth/otp/verify`, {
         method: 'POST',
+        credentials: 'include',  // sends the SSO cookie so the session is upgraded to 2FA too
         headers: {
           'Authorization': `Bearer ${accessToken.value}`,
           'Content-Type': 'application/json',
@@ -177,7 +205,21 @@ export function useCommaAuth(config?: CommaAuthConfig) {
     }
   }
 
-  function logout() {
+  // End the SSO session for every property, then forget local tokens
+  async function logout() {
+    try {
+      await fetch(`${authUrl.value}/auth/logout`, {
+        method: 'POST',
+        credentials: 'include',
+        headers: getAuthHeaders(),
+      })
+    } catch (error) {
+      console.error('Logout request failed:', error)
+    }
+    clearLocalAuth()
+  }
+
+  function clearLocalAuth() {
     accessToken.value = null
     refreshToken.value = null
     userInfo.value = null
@@ -205,6 +247,7 @@ export function useCommaAuth(config?: CommaAuthConfig) {
     
     // Methods
     initiateLogin,
+    trySessionLogin,
     handleAuthCallback,
     verifyToken,
     sendOTP,
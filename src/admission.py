@@ -0,0 +1,117 @@
+"""
+Admission control and load shedding
+
+Routes are classified into pools (e.g. verify vs login) so a flood of
+upstream-bound login traffic cannot starve /auth/verify. Each pool has a
+concurrency limit and a bounded queue; requests that find the queue full,
+or wait longer than the queue deadline, get a fast 503 with Retry-After.
+"""
+
+import asyncio
+import json
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class AdmissionPool:
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.active = 0
+        self.queued = 0
+        self.admitted = 0
+        self.shed_queue_full = 0
+        self.shed_queue_timeout = 0
+        self.queue_time_total = 0.0
+        self.queue_time_max = 0.0
+
+    async def acquire(self) -> bool:
+        """Wait for a slot; return False if the request should be shed"""
+        if self._semaphore.locked() and self.queued >= self.max_queue:
+            self.shed_queue_full += 1
+            return False
+
+        started = time.monotonic()
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.shed_queue_timeout += 1
+            return False
+        finally:
+            self.queued -= 1
+
+        waited = time.monotonic() - started
+        self.queue_time_total += waited
+        self.queue_time_max = max(self.queue_time_max, waited)
+        self.admitted += 1
+        self.active += 1
+        return True
+
+    def release(self):
+        self.active -= 1
+        self._semaphore.release()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "queued": self.queued,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_queue_timeout": self.shed_queue_timeout,
+            "queue_time_avg_ms": round(self.queue_time_total / self.admitted * 1000, 3) if self.admitted else 0.0,
+            "queue_time_max_ms": round(self.queue_time_max * 1000, 3),
+        }
+
+
+class AdmissionControlMiddleware:
+    """ASGI middleware routing requests through AdmissionPools by path prefix"""
+
+    def __init__(self, app, pools: Dict[str, AdmissionPool], routes: List[Tuple[str, str]], retry_after: int = 1):
+        self.app = app
+        self.pools = pools
+        self.routes = routes  # (path prefix, pool name), first match wins
+        self.retry_after = retry_after
+
+    def pool_for(self, path: str) -> Optional[AdmissionPool]:
+        for prefix, pool_name in self.routes:
+            if path.startswith(prefix):
+                return self.pools[pool_name]
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        pool = self.pool_for(scope["path"])
+        if pool is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not await pool.acquire():
+            await self._shed(pool, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            pool.release()
+
+    async def _shed(self, pool: AdmissionPool, send):
+        body = json.dumps({"detail": f"Service overloaded ({pool.name}), retry later"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(self.retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -2,15 +2,53 @@ import httpx
 from google.auth.transport.requests import Request
 from google.oauth2 import id_token
 from google_auth_oauthlib.flow import Flow
+from oauthlib.oauth2.rfc6749.errors import OAuth2Error, ServerError, TemporarilyUnavailableError
 from typing import Dict, Optional
-from ..config import settings
+from ..config import Settings, settings
 from ..models import UserInfo
+from ..profiling import span
+from ..resilience import Upstream
+
+class _TimeoutRequest(Request):
+    """google-auth transport that applies a default timeout (e.g. to cert fetches)"""
+    def __init__(self, timeout: float):
+        super().__init__()
+        self.timeout = timeout
+    
+    def __call__(self, url, method="GET", body=None, headers=None, timeout=None, **kwargs):
+        return super().__call__(url, method, body, headers, timeout=timeout or self.timeout, **kwargs)
+
+def _raise_for_server_error(response):
+    """Token response hook: oauthlib would report a 5xx error page as a malformed token response"""
+    if response.status_code >= 500:
+        response.raise_for_status()
+    return response
 
 class GoogleAuthProvider:
     def __init__(self):
         self.client_id = settings.GOOGLE_CLIENT_ID
         self.client_secret = settings.GOOGLE_CLIENT_SECRET
         self.redirect_uri = settings.GOOGLE_REDIRECT_URI
+        self.upstream = Upstream(
+            "google",
+            timeout=settings.GOOGLE_TIMEOUT_SECONDS,
+            max_concurrency=settings.GOOGLE_MAX_CONCURRENCY,
+            is_failure=self._is_upstream_failure
+        )
+    
+    def apply_settings(self, old: Settings, new: Settings):
+        """Reload hook; the bulkhead size is fixed at startup"""
+        self.client_id = new.GOOGLE_CLIENT_ID
+        self.client_secret = new.GOOGLE_CLIENT_SECRET
+        self.redirect_uri = new.GOOGLE_REDIRECT_URI
+        self.upstream.timeout = new.GOOGLE_TIMEOUT_SECONDS
+    
+    @staticmethod
+    def _is_upstream_failure(exc: BaseException) -> bool:
+        """OAuth errors (bad or replayed code) are the caller's fault; transport errors and 5xx are Google's"""
+        if isinstance(exc, (ServerError, TemporarilyUnavailableError)):
+            return True
+        return not isinstance(exc, OAuth2Error)
         
     def get_authorization_url(self, state: str) -> str:
         """Generate Google OAuth authorization URL"""
@@ -24,11 +62,12 @@ class GoogleAuthProvider:
                     "token_uri": "https://oauth2.googleapis.com/token"
                 }
             },
+            # Directory lookups use the service account in google_directory.py,
+            # so users are not asked to consent to admin scopes
             scopes=[
                 'openid',
                 'email', 
-                'profile',
-                'https://www.googleapis.com/auth/admin.directory.user.readonly'  # For workspace domain validation
+                'profile'
             ]
         )
         flow.redirect_uri = self.redirect_uri
@@ -44,64 +83,78 @@ class GoogleAuthProvider:
     
     async def exchange_code_for_token(self, code: str, state: str) -> Dict:
         """Exchange authorization code for access token"""
-        flow = Flow.from_client_config(
-            {
-                "web": {
-                    "client_id": self.client_id,
-                    "client_secret": self.client_secret,
-                    "redirect_uris": [self.redirect_uri],
-                    "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-                    "token_uri": "https://oauth2.googleapis.com/token"
-                }
-            },
-            scopes=[
-                'openid',
-                'email',
-                'profile', 
-                'https://www.googleapis.com/auth/admin.directory.user.readonly'
-            ]
-        )
-        flow.redirect_uri = self.redirect_uri
+        with span("flow_build"):
+            flow = Flow.from_client_config(
+                {
+                    "web": {
+                        "client_id": self.client_id,
+                        "client_secret": self.client_secret,
+                        "redirect_uris": [self.redirect_uri],
+                        "auth_uri": "https://accounts.google.com/o/oauth2/auth",
+                        "token_uri": "https://oauth2.googleapis.com/token"
+                    }
+                },
+                scopes=[
+                    'openid',
+                    'email',
+                    'profile'
+                ]
+            )
+            flow.redirect_uri = self.redirect_uri
+            flow.oauth2session.register_compliance_hook("access_token_response", _raise_for_server_error)
         
-        flow.fetch_token(code=code)
+        # fetch_token is blocking; keep it off the event loop and bounded
+        with span("google_token"):
+            await self.upstream.run_sync(flow.fetch_token, code=code, timeout=self.upstream.call_timeout())
         return flow.credentials._asdict()
     
     async def get_user_info(self, access_token: str) -> Optional[UserInfo]:
         """Get user information from Google"""
-        async with httpx.AsyncClient() as client:
-            # Get user info from Google API
-            response = await client.get(
-                "https://www.googleapis.com/oauth2/v2/userinfo",
-                headers={"Authorization": f"Bearer {access_token}"}
-            )
-            
-            if response.status_code != 200:
-                return None
-                
-            user_data = response.json()
+        async def fetch() -> httpx.Response:
+            async with httpx.AsyncClient(timeout=self.upstream.call_timeout()) as client:
+                response = await client.get(
+                    "https://www.googleapis.com/oauth2/v2/userinfo",
+                    headers={"Authorization": f"Bearer {access_token}"}
+                )
+                # Let 5xx count against the breaker (and trigger the hedge)
+                if response.status_code >= 500:
+                    response.raise_for_status()
+                return response
+        
+        # userinfo is an idempotent read, so it is safe to hedge
+        with span("google_userinfo"):
+            if settings.GOOGLE_HEDGE_AFTER_SECONDS > 0:
+                response = await self.upstream.hedged(fetch, settings.GOOGLE_HEDGE_AFTER_SECONDS)
+            else:
+                response = await self.upstream.call(fetch)
+        
+        if response.status_code != 200:
+            return None
             
-            # Extract domain from email
-            email = user_data.get("email", "")
-            domain = email.split("@")[1] if "@" in email else ""
+        user_data = response.json()
+        
+        # Extract domain from email
+        email = user_data.get("email", "")
+        domain = email.split("@")[1] if "@" in email else ""
+        
+        # Validate domain is in allowed list
+        if domain not in settings.ALLOWED_DOMAINS:
+            return None
             
-            # Validate domain is in allowed list
-            if domain not in settings.ALLOWED_DOMAINS:
-                return None
-                
-            return UserInfo(
-                email=email,
-                name=user_data.get("name", ""),
-                picture=user_data.get("picture"),
-                domain=domain,
-                provider="google"
-            )
+        return UserInfo(
+            email=email,
+            name=user_data.get("name", ""),
+            picture=user_data.get("picture"),
+            domain=domain,
+            provider="google"
+        )
     
     def verify_token(self, token: str) -> Optional[Dict]:
         """Verify Google ID token"""
         try:
             # Verify the token
             idinfo = id_token.verify_oauth2_token(
-                token, Request(), self.client_id
+                token, _TimeoutRequest(self.upstream.timeout), self.client_id
             )
             
             # Verify domain restriction
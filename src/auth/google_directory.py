@@ -0,0 +1,325 @@
+"""
+Google Workspace directory lookups for scope assignment
+
+Scopes come from DIRECTORY_SCOPE_RULES, keyed by "group:<group email>" or
+"orgunit:<org unit path>". A background task periodically rebuilds a
+membership index for every user with one paginated query per mapped group
+plus one users listing, so logins normally never wait on the Directory API.
+Users missing from a stale index fall back to a per-user TTL cache
+(with shorter-lived negative entries) filled by single-flight lookups.
+"""
+
+import asyncio
+import time
+from typing import Dict, FrozenSet, List, NamedTuple, Optional
+
+import httpx
+from google.auth.transport.requests import Request
+from google.oauth2 import service_account
+
+from ..config import Settings, settings
+from ..resilience import Upstream
+
+DIRECTORY_SCOPES = [
+    "https://www.googleapis.com/auth/admin.directory.user.readonly",
+    "https://www.googleapis.com/auth/admin.directory.group.readonly",
+]
+
+
+class DirectoryEntry(NamedTuple):
+    memberships: FrozenSet[str]
+    fetched_at: float
+    positive: bool
+
+
+class GoogleDirectory:
+    def __init__(self):
+        self.upstream = Upstream(
+            "google_directory",
+            timeout=settings.GOOGLE_TIMEOUT_SECONDS,
+            max_concurrency=settings.GOOGLE_MAX_CONCURRENCY
+        )
+        self.credentials = None
+        self._configure(settings)
+        self._load_credentials(settings)
+
+        # Bumped whenever cached memberships become invalid; results fetched under an
+        # older generation are discarded instead of repopulating the caches
+        self._generation = 0
+        self._refresh_requested = asyncio.Event()
+        self._cache: Dict[str, DirectoryEntry] = {}
+        self._index: Dict[str, FrozenSet[str]] = {}
+        self._index_loaded_at: Optional[float] = None  # None: no index (monotonic time can be small after boot)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._prefetches: set = set()
+
+        self.index_hits = 0
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.fetch_errors = 0
+        self.fetch_count = 0
+        self.fetch_time_total = 0.0
+        self.last_refresh_ms = 0.0
+
+    def _configure(self, config):
+        self.base_url = config.GOOGLE_DIRECTORY_URL.rstrip("/")
+        # Group emails are case-insensitive; org unit paths are compared as given
+        self.rules: Dict[str, List[str]] = {
+            key.lower() if key.startswith("group:") else key: scopes
+            for key, scopes in config.DIRECTORY_SCOPE_RULES.items()
+        }
+        self.default_scopes = config.DIRECTORY_DEFAULT_SCOPES
+        self.ttl = config.DIRECTORY_CACHE_TTL_SECONDS
+        self.negative_ttl = config.DIRECTORY_NEGATIVE_TTL_SECONDS
+        self.refresh_interval = config.DIRECTORY_REFRESH_SECONDS
+        self.group_rules = [key[len("group:"):] for key in self.rules if key.startswith("group:")]
+        self.orgunit_rules = [key[len("orgunit:"):] for key in self.rules if key.startswith("orgunit:")]
+        self.upstream.timeout = config.GOOGLE_TIMEOUT_SECONDS
+
+    def _load_credentials(self, config):
+        self.credentials = None
+        if config.GOOGLE_DIRECTORY_CREDENTIALS_FILE:
+            self.credentials = service_account.Credentials.from_service_account_file(
+                config.GOOGLE_DIRECTORY_CREDENTIALS_FILE, scopes=DIRECTORY_SCOPES
+            ).with_subject(config.GOOGLE_DIRECTORY_ADMIN_EMAIL)
+
+    def apply_settings(self, old: Settings, new: Settings):
+        """Reload hook: only a different tenant or rule set invalidates cached memberships"""
+        self._configure(new)
+        new_credentials = (new.GOOGLE_DIRECTORY_CREDENTIALS_FILE, new.GOOGLE_DIRECTORY_ADMIN_EMAIL)
+        if new_credentials != (old.GOOGLE_DIRECTORY_CREDENTIALS_FILE, old.GOOGLE_DIRECTORY_ADMIN_EMAIL):
+            self._load_credentials(new)  # otherwise keep the cached access token
+        elif new.GOOGLE_DIRECTORY_URL == old.GOOGLE_DIRECTORY_URL \
+                and new.DIRECTORY_SCOPE_RULES == old.DIRECTORY_SCOPE_RULES:
+            return  # TTLs, default scopes or unrelated settings: cached memberships stay valid
+
+        # Memberships only record rule keys, so anything cached may grant stale scopes
+        self._generation += 1
+        self._cache = {}
+        self._index = {}
+        self._index_loaded_at = None
+        if not self.enabled:
+            return
+        # Rebuild now rather than after the current refresh interval
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.get_running_loop().create_task(self._refresh_loop())
+        else:
+            self._refresh_requested.set()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.rules)
+
+    async def scopes_for(self, email: str, fallback: List[str]) -> List[str]:
+        """Scopes granted by directory membership, or `fallback` if no rules are configured"""
+        if not self.enabled:
+            return fallback
+        memberships = await self.memberships(email)
+        scopes: List[str] = []
+        for key, rule_scopes in self.rules.items():
+            if key in memberships:
+                scopes.extend(scope for scope in rule_scopes if scope not in scopes)
+        return scopes or list(self.default_scopes)
+
+    async def memberships(self, email: str) -> FrozenSet[str]:
+        email = email.lower()
+        now = time.monotonic()
+
+        if self._index_loaded_at is not None and now - self._index_loaded_at < self.ttl:
+            self.index_hits += 1
+            return self._index.get(email, frozenset())
+
+        entry = self._cache.get(email)
+        if entry is not None and now - entry.fetched_at < (self.ttl if entry.positive else self.negative_ttl):
+            if entry.positive:
+                self.hits += 1
+            else:
+                self.negative_hits += 1
+            return entry.memberships
+
+        self.misses += 1
+        try:
+            return (await self._lookup(email)).memberships
+        except Exception:
+            self.fetch_errors += 1
+            # Serve stale data rather than failing the login; otherwise no memberships
+            return entry.memberships if entry is not None else frozenset()
+
+    def prefetch(self, email: str):
+        """Warm the cache in the background (e.g. at login, ahead of OTP verification)"""
+        if self.enabled:
+            task = asyncio.ensure_future(self.memberships(email))
+            self._prefetches.add(task)
+            task.add_done_callback(self._prefetches.discard)
+
+    async def _lookup(self, email: str) -> DirectoryEntry:
+        """Single-flight per-user lookup: concurrent misses share one fetch"""
+        future = self._inflight.get(email)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[email] = future
+        generation = self._generation
+        try:
+            entry = await self._fetch_user(email)
+            if generation == self._generation:
+                self._cache[email] = entry
+            future.set_result(entry)
+            return entry
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else is waiting
+            raise
+        finally:
+            del self._inflight[email]
+
+    async def _fetch_user(self, email: str) -> DirectoryEntry:
+        started = time.perf_counter()
+
+        async def no_lookup():
+            return None
+
+        try:
+            # Group and org unit lookups are independent; issue them together
+            groups, user = await asyncio.gather(
+                self._paginate("/groups", {"userKey": email}, "groups") if self.group_rules else no_lookup(),
+                self._get_json(f"/users/{email}", {"fields": "primaryEmail,orgUnitPath"}) if self.orgunit_rules else no_lookup()
+            )
+        finally:
+            self.fetch_count += 1
+            self.fetch_time_total += time.perf_counter() - started
+
+        memberships = set()
+        if groups:
+            memberships.update(
+                f"group:{group['email'].lower()}" for group in groups
+                if group.get("email", "").lower() in self.group_rules
+            )
+        if user:
+            memberships.update(self._orgunit_memberships(user.get("orgUnitPath", "/")))
+        # Unknown users and users matching no rule are cached for the shorter negative TTL
+        return DirectoryEntry(frozenset(memberships), time.monotonic(), bool(memberships))
+
+    def _orgunit_memberships(self, org_unit_path: str) -> List[str]:
+        return [
+            f"orgunit:{rule}" for rule in self.orgunit_rules
+            if org_unit_path == rule or org_unit_path.startswith(rule.rstrip("/") + "/")
+        ]
+
+    async def refresh_index(self):
+        """Rebuild the email -> memberships index with batched group/user listings"""
+        started = time.perf_counter()
+        generation = self._generation
+        index: Dict[str, set] = {}
+
+        async def load_group(group: str):
+            members = await self._paginate(
+                f"/groups/{group}/members", {"includeDerivedMembership": "true"}, "members"
+            )
+            for member in members or []:
+                if member.get("type", "USER") == "USER" and member.get("email"):
+                    index.setdefault(member["email"].lower(), set()).add(f"group:{group}")
+
+        async def load_orgunits():
+            users = await self._paginate(
+                "/users", {"customer": "my_customer", "fields": "users(primaryEmail,orgUnitPath),nextPageToken"}, "users"
+            )
+            for user in users or []:
+                for key in self._orgunit_memberships(user.get("orgUnitPath", "/")):
+                    index.setdefault(user["primaryEmail"].lower(), set()).add(key)
+
+        jobs = [load_group(group) for group in self.group_rules]
+        if self.orgunit_rules:
+            jobs.append(load_orgunits())
+        await asyncio.gather(*jobs)
+        if generation != self._generation:
+            return  # settings changed mid-refresh; the requested rebuild will replace it
+
+        self._index = {email: frozenset(keys) for email, keys in index.items()}
+        self._index_loaded_at = time.monotonic()
+        self.last_refresh_ms = round((time.perf_counter() - started) * 1000, 3)
+
+    async def start(self):
+        if self.enabled and self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+    async def _refresh_loop(self):
+        while True:
+            self._refresh_requested.clear()
+            try:
+                await self.refresh_index()
+            except Exception:
+                # Keep serving the previous index / per-user cache until the next attempt
+                self.fetch_errors += 1
+            try:
+                await asyncio.wait_for(self._refresh_requested.wait(), self.refresh_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _auth_headers(self) -> Dict[str, str]:
+        if self.credentials is None:
+            return {}
+        if not self.credentials.valid:
+            await self.upstream.run_sync(self.credentials.refresh, Request())
+        return {"Authorization": f"Bearer {self.credentials.token}"}
+
+    async def _get_json(self, path: str, params: Dict[str, str]) -> Optional[Dict]:
+        """GET a Directory API resource; None if it does not exist"""
+        headers = await self._auth_headers()
+
+        async def fetch() -> httpx.Response:
+            async with httpx.AsyncClient(timeout=self.upstream.call_timeout()) as client:
+                response = await client.get(f"{self.base_url}{path}", params=params, headers=headers)
+                if response.status_code >= 500:
+                    response.raise_for_status()
+                return response
+
+        response = await self.upstream.call(fetch)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()
+
+    async def _paginate(self, path: str, params: Dict[str, str], items_key: str) -> Optional[List[Dict]]:
+        items: List[Dict] = []
+        page_token = None
+        while True:
+            page_params = dict(params, maxResults="200")
+            if page_token:
+                page_params["pageToken"] = page_token
+            data = await self._get_json(path, page_params)
+            if data is None:
+                return None
+            items.extend(data.get(items_key, []))
+            page_token = data.get("nextPageToken")
+            if not page_token:
+                return items
+
+    def snapshot(self) -> Dict:
+        lookups = self.index_hits + self.hits + self.negative_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "index_users": len(self._index),
+            "index_age_seconds": round(time.monotonic() - self._index_loaded_at, 1) if self._index_loaded_at is not None else None,
+            "last_refresh_ms": self.last_refresh_ms,
+            "cached_users": len(self._cache),
+            "index_hits": self.index_hits,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "hit_rate": round((lookups - self.misses) / lookups, 4) if lookups else 0.0,
+            "fetch_errors": self.fetch_errors,
+            "fetch_time_avg_ms": round(self.fetch_time_total / self.fetch_count * 1000, 3) if self.fetch_count else 0.0,
+        }
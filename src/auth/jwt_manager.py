@@ -1,15 +1,110 @@
+import hashlib
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 from jose import JWTError, jwt
-from ..config import settings
+from ..config import Settings, settings
 from ..models import UserInfo, TokenValidation
+from .shared_cache import SharedVerificationCache
+
+class TokenExchangeError(Exception):
+    """RFC 8693 error (`error` is the OAuth error code)"""
+    def __init__(self, error: str, description: str):
+        self.error = error
+        self.description = description
+        super().__init__(description)
+
+class ExchangedTokenCache:
+    """LRU of minted exchange tokens keyed by (subject token digest, audience, scopes)"""
+    
+    def __init__(self, max_entries: int = 10000, min_remaining_seconds: int = 30):
+        self.max_entries = max_entries
+        self.min_remaining_seconds = min_remaining_seconds
+        self._entries: "OrderedDict[Tuple, Tuple[str, int, List[str]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def key(subject_token: str, audience: str, scopes: Optional[List[str]]) -> Tuple:
+        digest = hashlib.sha256(subject_token.encode()).digest()
+        return (digest, audience, tuple(sorted(set(scopes))) if scopes is not None else None)
+    
+    def get(self, key: Tuple) -> Optional[Tuple[str, int, List[str]]]:
+        entry = self._entries.get(key)
+        if entry is None or entry[1] - time.time() < self.min_remaining_seconds:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+    
+    def put(self, key: Tuple, token: str, exp: int, scopes: List[str]):
+        self._entries[key] = (token, exp, scopes)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def clear(self):
+        self._entries.clear()
+    
+    def snapshot(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
 
 class JWTManager:
     def __init__(self):
         self.secret_key = settings.JWT_SECRET_KEY
+        self.previous_secret_key = settings.JWT_PREVIOUS_SECRET_KEY
         self.algorithm = settings.JWT_ALGORITHM
         self.access_token_expire_minutes = settings.ACCESS_TOKEN_EXPIRE_MINUTES
         self.refresh_token_expire_days = settings.REFRESH_TOKEN_EXPIRE_DAYS
+        self.exchange_cache = ExchangedTokenCache(max_entries=settings.TOKEN_EXCHANGE_CACHE_SIZE)
+        self.verify_cache: Optional[SharedVerificationCache] = None
+        if settings.SHARED_VERIFY_CACHE_PATH:
+            self.verify_cache = SharedVerificationCache(
+                settings.SHARED_VERIFY_CACHE_PATH,
+                secret=self._verification_secret(),
+                slots=settings.SHARED_VERIFY_CACHE_SLOTS
+            )
+    
+    def apply_settings(self, old: Settings, new: Settings):
+        """Reload hook: pick up a rotated signing key and new expiry times"""
+        self.previous_secret_key = new.JWT_PREVIOUS_SECRET_KEY
+        self.algorithm = new.JWT_ALGORITHM
+        self.access_token_expire_minutes = new.ACCESS_TOKEN_EXPIRE_MINUTES
+        self.refresh_token_expire_days = new.REFRESH_TOKEN_EXPIRE_DAYS
+        changed = (
+            new.JWT_SECRET_KEY != old.JWT_SECRET_KEY
+            or new.JWT_PREVIOUS_SECRET_KEY != old.JWT_PREVIOUS_SECRET_KEY
+            or new.JWT_ALGORITHM != old.JWT_ALGORITHM
+        )
+        self.secret_key = new.JWT_SECRET_KEY
+        if changed:
+            # Any change to the accepted keys, including dropping the previous one at the
+            # end of a rotation, must stop cached results from vouching for retired keys
+            self.exchange_cache.clear()
+            if self.verify_cache is not None:
+                # Records are keyed with the accepted keys, so old ones simply stop matching
+                self.verify_cache.rekey(self._verification_secret())
+    
+    def _verification_secret(self) -> str:
+        """Everything that decides whether a token verifies; keys the shared verify cache"""
+        return f"{self.algorithm}\0{self.secret_key}\0{self.previous_secret_key}"
+    
+    def _decode(self, token: str, **options) -> Dict[str, Any]:
+        """Decode with the current key, falling back to the previous one during a rotation"""
+        try:
+            return jwt.decode(token, self.secret_key, algorithms=[self.algorithm], **options)
+        except JWTError:
+            if not self.previous_secret_key:
+                raise
+        return jwt.decode(token, self.previous_secret_key, algorithms=[self.algorithm], **options)
     
     def create_access_token(self, user_info: UserInfo, scopes: list = None, requires_2fa: bool = False) -> str:
         """Create JWT access token"""
@@ -51,10 +146,22 @@ class JWTManager:
         
         return jwt.encode(to_encode, self.secret_key, algorithm=self.algorithm)
     
-    def verify_token(self, token: str) -> TokenValidation:
+    def verify_token(self, token: str, audience: str = "comma-apps") -> TokenValidation:
         """Verify and decode JWT token"""
+        if self.verify_cache is not None:
+            cached = self.verify_cache.get(token, audience)
+            if cached is not None:
+                return cached
+        
+        validation = self._verify_token(token, audience)
+        if self.verify_cache is not None and validation.valid:
+            self.verify_cache.put(token, audience, validation)
+        return validation
+    
+    def _verify_token(self, token: str, audience: str) -> TokenValidation:
         try:
-            payload = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+            # jose rejects any token carrying "aud" unless the expected audience is passed
+            payload = self._decode(token, audience=audience)
             
             # Check if token is expired
             exp = payload.get("exp")
@@ -74,7 +181,8 @@ class JWTManager:
                 valid=True,
                 user_info=user_info,
                 scopes=payload.get("scopes", []),
-                expires_at=datetime.utcfromtimestamp(exp) if exp else None
+                expires_at=datetime.utcfromtimestamp(exp) if exp else None,
+                requires_2fa=payload.get("requires_2fa", False)
             )
             
         except JWTError:
@@ -83,7 +191,7 @@ class JWTManager:
     def verify_refresh_token(self, token: str) -> Optional[str]:
         """Verify refresh token and return user email"""
         try:
-            payload = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+            payload = self._decode(token)
             
             # Check if it's a refresh token
             if payload.get("type") != "refresh":
@@ -104,4 +212,49 @@ class JWTManager:
         if scopes is None:
             scopes = ["read", "write"]  # Enhanced permissions after 2FA
             
-        return self.create_access_token(user_info, scopes, requires_2fa=False)
\ No newline at end of file
+        return self.create_access_token(user_info, scopes, requires_2fa=False)
+    
+    def exchange_token(self, subject_token: str, audience: str, scopes: Optional[List[str]] = None) -> Tuple[str, int, List[str]]:
+        """
+        Mint a short-lived, audience-restricted token downscoped from `subject_token`.
+        Returns (token, exp timestamp, granted scopes); repeated exchanges are served
+        from cache without re-verifying or re-signing.
+        """
+        key = self.exchange_cache.key(subject_token, audience, scopes)
+        cached = self.exchange_cache.get(key)
+        if cached is not None:
+            # Safe to skip verification: the entry never outlives the subject token
+            return cached
+        
+        subject = self.verify_token(subject_token)
+        if not subject.valid:
+            raise TokenExchangeError("invalid_grant", "Invalid subject token")
+        
+        granted = list(subject.scopes) if scopes is None else scopes
+        if not set(granted) <= set(subject.scopes):
+            raise TokenExchangeError("invalid_scope", "Requested scopes exceed the subject token's scopes")
+        
+        expire = datetime.utcnow() + timedelta(minutes=settings.TOKEN_EXCHANGE_EXPIRE_MINUTES)
+        if subject.expires_at and subject.expires_at < expire:
+            expire = subject.expires_at
+        
+        user_info = subject.user_info
+        to_encode = {
+            "sub": user_info.email,
+            "name": user_info.name,
+            "email": user_info.email,
+            "domain": user_info.domain,
+            "provider": user_info.provider,
+            "picture": user_info.picture,
+            "scopes": granted,
+            "requires_2fa": subject.requires_2fa,
+            "exp": expire,
+            "iat": datetime.utcnow(),
+            "iss": "comma-auth",
+            "aud": audience
+        }
+        token = jwt.encode(to_encode, self.secret_key, algorithm=self.algorithm)
+        
+        exp = int((expire - datetime(1970, 1, 1)).total_seconds())
+        self.exchange_cache.put(key, token, exp, granted)
+        return token, exp, granted
@@ -6,12 +6,18 @@ import httpx
 from typing import Dict, Optional
 from ..config import settings
 from ..models import UserInfo
+from ..resilience import Upstream, UpstreamUnavailable
 
 class MicrosoftAuthProvider:
     def __init__(self):
         self.client_id = settings.MICROSOFT_CLIENT_ID
         self.client_secret = settings.MICROSOFT_CLIENT_SECRET
         self.tenant = "common"  # Allow work/school and personal accounts
+        self.upstream = Upstream(
+            "microsoft",
+            timeout=settings.MICROSOFT_TIMEOUT_SECONDS,
+            max_concurrency=settings.MICROSOFT_MAX_CONCURRENCY
+        )
         
     def get_authorization_url(self, state: str) -> str:
         """Generate Microsoft OAuth authorization URL"""
@@ -40,43 +46,58 @@ class MicrosoftAuthProvider:
             'redirect_uri': settings.GOOGLE_REDIRECT_URI.replace('google', 'microsoft'),
         }
         
-        async with httpx.AsyncClient() as client:
-            response = await client.post(token_url, data=data)
-            
-            if response.status_code == 200:
-                return response.json()
-            else:
-                raise Exception(f"Token exchange failed: {response.text}")
+        async def post() -> httpx.Response:
+            async with httpx.AsyncClient(timeout=self.upstream.call_timeout()) as client:
+                response = await client.post(token_url, data=data)
+                # Let 5xx count against the breaker; 4xx is the caller's bad code
+                if response.status_code >= 500:
+                    response.raise_for_status()
+                return response
+        
+        response = await self.upstream.call(post)
+        
+        if response.status_code == 200:
+            return response.json()
+        else:
+            raise Exception(f"Token exchange failed: {response.text}")
     
     async def get_user_info(self, access_token: str) -> Optional[UserInfo]:
         """Get user information from Microsoft Graph API"""
-        try:
-            async with httpx.AsyncClient() as client:
+        async def fetch() -> httpx.Response:
+            async with httpx.AsyncClient(timeout=self.upstream.call_timeout()) as client:
                 # Get user profile from Microsoft Graph
                 response = await client.get(
                     "https://graph.microsoft.com/v1.0/me",
                     headers={"Authorization": f"Bearer {access_token}"}
                 )
+                if response.status_code >= 500:
+                    response.raise_for_status()
+                return response
+        
+        try:
+            response = await self.upstream.call(fetch)
+            
+            if response.status_code != 200:
+                return None
                 
-                if response.status_code != 200:
-                    return None
-                    
-                user_data = response.json()
-                
-                email = user_data.get('mail') or user_data.get('userPrincipalName', '')
-                domain = email.split('@')[1] if '@' in email else ''
-                
-                # Validate domain is in allowed list
-                if domain not in settings.ALLOWED_DOMAINS:
-                    return None
-                    
-                return UserInfo(
-                    email=email,
-                    name=user_data.get('displayName', ''),
-                    picture=None,  # Could get from Graph API if needed
-                    domain=domain,
-                    provider="microsoft"
-                )
+            user_data = response.json()
+            
+            email = user_data.get('mail') or user_data.get('userPrincipalName', '')
+            domain = email.split('@')[1] if '@' in email else ''
+            
+            # Validate domain is in allowed list
+            if domain not in settings.ALLOWED_DOMAINS:
+                return None
                 
+            return UserInfo(
+                email=email,
+                name=user_data.get('displayName', ''),
+                picture=None,  # Could get from Graph API if needed
+                domain=domain,
+                provider="microsoft"
+            )
+            
+        except UpstreamUnavailable:
+            raise
         except Exception:
             return None
\ No newline at end of file
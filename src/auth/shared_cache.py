@@ -0,0 +1,218 @@
+"""
+Cross-worker shared-memory cache of verified tokens
+
+A fixed-size open-addressing table in an mmap'd file (e.g. under /dev/shm),
+so every `uvicorn --workers N` process on a host shares one warm cache.
+Each 128-byte slot holds a compact verification record keyed by a digest
+of (audience, token), keyed with the accepted signing keys so records made
+before a key change can never match again:
+
+    seq u32 | digest 16s | exp u32 | scopes u16 | flags u8 | sub_len u8 | sub 100s
+
+Readers never lock: a per-slot seqlock (odd = write in progress) lets them
+detect torn reads and treat them as misses. Writers bump the sequence
+around the update and take a non-blocking fcntl lock on the slot so two
+processes never write the same slot at once.
+
+A file is never resized while mapped (that SIGBUSes every other worker
+mapping it). A worker expecting a different layout, e.g. after
+SHARED_VERIFY_CACHE_SLOTS changed during a rolling restart, builds a fresh
+file and renames it over the path; older workers keep their own table
+until they restart.
+"""
+
+import base64
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import struct
+import time
+from datetime import datetime
+from typing import Optional
+
+from ..models import TokenValidation, UserInfo
+
+MAGIC = b"CAVC"
+HEADER = struct.Struct("<4sII")  # magic, version, slot count
+HEADER_SIZE = 64
+VERSION = 1
+
+SLOT = struct.Struct("<I16sIHBB100s")
+SLOT_SIZE = 128
+RECORD = struct.Struct("<16sIHBB100s")  # SLOT without seq
+PROBES = 4
+
+# Scopes are stored as a bitmask; tokens carrying anything else are not cached
+SCOPE_BITS = {"read": 1, "write": 2, "admin": 4}
+FLAG_REQUIRES_2FA = 1
+
+
+def _scopes_to_mask(scopes) -> Optional[int]:
+    mask = 0
+    for scope in scopes:
+        bit = SCOPE_BITS.get(scope)
+        if bit is None:
+            return None
+        mask |= bit
+    return mask
+
+
+def _mask_to_scopes(mask: int):
+    return [scope for scope, bit in SCOPE_BITS.items() if mask & bit]
+
+
+class SharedVerificationCache:
+    def __init__(self, path: str, secret: str, slots: int = 65536):
+        self.path = path
+        self.slots = slots
+        self.rekey(secret)
+        size = HEADER_SIZE + slots * SLOT_SIZE
+        # Serializes opening/creating the table; the table file itself is replaced, so it can't hold the lock
+        lock_fd = os.open(f"{path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            self.fd = self._open_matching(size) or self._create(size)
+        finally:
+            os.close(lock_fd)  # releases the flock
+        self.map = mmap.mmap(self.fd, size)
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.write_conflicts = 0
+
+    def _open_matching(self, size: int) -> Optional[int]:
+        """fd of the existing table if it has our layout, else None"""
+        try:
+            fd = os.open(self.path, os.O_RDWR)
+        except FileNotFoundError:
+            return None
+        if os.fstat(fd).st_size == size and os.pread(fd, HEADER.size, 0) == HEADER.pack(MAGIC, VERSION, self.slots):
+            return fd
+        os.close(fd)
+        return None
+
+    def _create(self, size: int) -> int:
+        """Build an empty table beside the path and swap it in; workers mapping the old file are unaffected"""
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        fd = os.open(tmp, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.ftruncate(fd, size)
+            os.pwrite(fd, HEADER.pack(MAGIC, VERSION, self.slots), 0)
+            os.replace(tmp, self.path)
+        except OSError:
+            os.close(fd)
+            os.unlink(tmp)
+            raise
+        return fd
+
+    def digest(self, token: str, audience: str) -> bytes:
+        return hashlib.blake2b(f"{audience}\0{token}".encode(), digest_size=16, key=self.key).digest()
+
+    def _offset(self, index: int) -> int:
+        return HEADER_SIZE + (index % self.slots) * SLOT_SIZE
+
+    def get(self, token: str, audience: str) -> Optional[TokenValidation]:
+        """Lock-free lookup; any torn or concurrent read is treated as a miss"""
+        digest = self.digest(token, audience)
+        start = int.from_bytes(digest[:8], "little")
+        now = int(time.time())
+        for probe in range(PROBES):
+            offset = self._offset(start + probe)
+            seq, slot_digest, exp, scopes, flags, sub_len, sub = SLOT.unpack_from(self.map, offset)
+            if seq & 1 or slot_digest != digest:
+                continue
+            if struct.unpack_from("<I", self.map, offset)[0] != seq:
+                continue
+            if exp <= now:
+                break
+            validation = self._build(token, sub[:sub_len].decode(), exp, scopes, flags)
+            if validation is not None:
+                self.hits += 1
+                return validation
+            break
+        self.misses += 1
+        return None
+
+    def _build(self, token: str, subject: str, exp: int, scopes: int, flags: int) -> Optional[TokenValidation]:
+        # The digest matched a token we already verified, so its payload is trusted as-is;
+        # only display fields (name, picture, ...) come from it, never the security claims
+        try:
+            payload_segment = token.split(".")[1]
+            payload = json.loads(base64.urlsafe_b64decode(payload_segment + "=" * (-len(payload_segment) % 4)))
+        except (IndexError, ValueError):
+            return None
+        if payload.get("email") != subject:
+            return None
+        # model_construct skips re-validation (EmailStr alone costs ~150us); it passed on the miss path
+        return TokenValidation.model_construct(
+            valid=True,
+            user_info=UserInfo.model_construct(
+                email=subject,
+                name=payload.get("name"),
+                picture=payload.get("picture"),
+                domain=payload.get("domain"),
+                provider=payload.get("provider")
+            ),
+            scopes=_mask_to_scopes(scopes),
+            expires_at=datetime.utcfromtimestamp(exp),
+            requires_2fa=bool(flags & FLAG_REQUIRES_2FA)
+        )
+
+    def put(self, token: str, audience: str, validation: TokenValidation):
+        """Insert a verified record; silently skipped if it can't be encoded or the slot is busy"""
+        if not validation.valid or validation.expires_at is None or validation.user_info is None:
+            return
+        mask = _scopes_to_mask(validation.scopes)
+        subject = validation.user_info.email.encode()
+        if mask is None or len(subject) > 100:
+            return
+
+        digest = self.digest(token, audience)
+        start = int.from_bytes(digest[:8], "little")
+        now = int(time.time())
+        exp = int((validation.expires_at - datetime(1970, 1, 1)).total_seconds())
+
+        # Prefer the slot already holding this digest, then an empty/expired one, else evict the soonest to expire
+        target, target_exp = None, None
+        for probe in range(PROBES):
+            offset = self._offset(start + probe)
+            _, slot_digest, slot_exp, *_ = SLOT.unpack_from(self.map, offset)
+            if slot_digest == digest or slot_exp <= now:
+                target = offset
+                break
+            if target_exp is None or slot_exp < target_exp:
+                target, target_exp = offset, slot_exp
+
+        try:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB, SLOT_SIZE, target, os.SEEK_SET)
+        except OSError:
+            self.write_conflicts += 1
+            return
+        try:
+            seq = struct.unpack_from("<I", self.map, target)[0]
+            if seq & 1:
+                seq += 1  # a writer died mid-update; recover the slot
+            struct.pack_into("<I", self.map, target, (seq + 1) & 0xFFFFFFFF)
+            flags = FLAG_REQUIRES_2FA if validation.requires_2fa else 0
+            RECORD.pack_into(self.map, target + 4, digest, exp, mask, flags, len(subject), subject)
+            struct.pack_into("<I", self.map, target, (seq + 2) & 0xFFFFFFFF)
+            self.writes += 1
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, SLOT_SIZE, target, os.SEEK_SET)
+
+    def rekey(self, secret: str):
+        """Switch to a new digest key; records made under the old one can never match again"""
+        self.key = hashlib.sha256(secret.encode()).digest()
+
+    def snapshot(self):
+        total = self.hits + self.misses
+        return {
+            "slots": self.slots,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "writes": self.writes,
+            "write_conflicts": self.write_conflicts,
+        }
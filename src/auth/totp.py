@@ -0,0 +1,215 @@
+"""
+Local TOTP (RFC 6238) second factor
+
+A zero-upstream alternative to Twilio SMS: secrets are generated here,
+stored Fernet-encrypted in a local SQLite file, and codes are checked
+in-process. Each accepted time-step is recorded so a code cannot be
+replayed; the conditional UPDATE makes that guard hold across workers.
+After TOTP_MAX_FAILED_ATTEMPTS wrong codes the user is locked out for
+TOTP_LOCKOUT_SECONDS, counted in the same row so every worker sees it.
+
+TOTP is disabled unless TOTP_ENCRYPTION_KEY is set. To rotate it, list the
+old key in TOTP_PREVIOUS_ENCRYPTION_KEYS; each secret is re-encrypted under
+the new key the next time it is used successfully.
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import sqlite3
+import struct
+import time
+from typing import Dict, Optional
+from urllib.parse import quote, urlencode
+
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+
+from ..config import Settings, settings
+
+PERIOD = 30
+DIGITS = 6
+WINDOW = 1  # accept codes one step either side for clock drift
+
+
+def hotp(secret: bytes, counter: int) -> str:
+    digest = hmac.new(secret, struct.pack(">Q", counter), hashlib.sha1).digest()
+    offset = digest[-1] & 0x0F
+    code = struct.unpack(">I", digest[offset:offset + 4])[0] & 0x7FFFFFFF
+    return str(code % 10 ** DIGITS).zfill(DIGITS)
+
+
+class TOTPLockedOut(Exception):
+    """Raised while a user is locked out after too many wrong codes"""
+
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(f"Too many failed attempts; retry in {int(retry_after) + 1}s")
+
+
+class TOTPProvider:
+    def __init__(self, event_log=None):
+        self.event_log = event_log
+        self.primary: Optional[Fernet] = None
+        self.fernet: Optional[MultiFernet] = None
+        self._load_keys(settings)
+        self.issuer = settings.TOTP_ISSUER
+        self.max_failed_attempts = settings.TOTP_MAX_FAILED_ATTEMPTS
+        self.lockout_seconds = settings.TOTP_LOCKOUT_SECONDS
+
+        directory = os.path.dirname(os.path.abspath(settings.TOTP_STORE_PATH))
+        os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(settings.TOTP_STORE_PATH, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # `secret` is the active authenticator (once confirmed); a re-enrollment waits
+        # in `pending_secret` until confirm() swaps it in
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS totp ("
+            " email TEXT PRIMARY KEY,"
+            " secret BLOB NOT NULL,"
+            " confirmed INTEGER NOT NULL DEFAULT 0,"
+            " pending_secret BLOB,"
+            " last_step INTEGER NOT NULL DEFAULT 0,"
+            " failed_attempts INTEGER NOT NULL DEFAULT 0,"
+            " locked_until REAL NOT NULL DEFAULT 0,"
+            " created_at REAL NOT NULL)"
+        )
+        self._migrate()
+
+    def _migrate(self):
+        """Add columns introduced after a store was first created"""
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(totp)")}
+        for name, definition in (
+            ("failed_attempts", "INTEGER NOT NULL DEFAULT 0"),
+            ("locked_until", "REAL NOT NULL DEFAULT 0"),
+            ("pending_secret", "BLOB"),
+        ):
+            if name not in columns:
+                try:
+                    self.conn.execute(f"ALTER TABLE totp ADD COLUMN {name} {definition}")
+                except sqlite3.OperationalError:
+                    pass  # another worker added it first
+        # Older stores kept an unconfirmed enrollment in `secret`
+        self.conn.execute("UPDATE totp SET pending_secret = secret WHERE confirmed = 0 AND pending_secret IS NULL")
+
+    @property
+    def enabled(self) -> bool:
+        return self.fernet is not None
+
+    def _load_keys(self, config):
+        # Keys come only from configuration (never derived from other secrets), so a
+        # restart or an unrelated rotation can't make stored secrets undecryptable
+        if not config.TOTP_ENCRYPTION_KEY:
+            self.primary, self.fernet = None, None
+            return
+        self.primary = Fernet(config.TOTP_ENCRYPTION_KEY)
+        self.fernet = MultiFernet([self.primary] + [Fernet(key) for key in config.TOTP_PREVIOUS_ENCRYPTION_KEYS])
+
+    def apply_settings(self, old: Settings, new: Settings):
+        """Reload hook: encrypt with a rotated key, still decrypt secrets under the listed previous ones"""
+        self._load_keys(new)
+        self.issuer = new.TOTP_ISSUER
+        self.max_failed_attempts = new.TOTP_MAX_FAILED_ATTEMPTS
+        self.lockout_seconds = new.TOTP_LOCKOUT_SECONDS
+
+    def is_enrolled(self, email: str) -> bool:
+        row = self.conn.execute("SELECT confirmed FROM totp WHERE email = ?", (email,)).fetchone()
+        return bool(row and row[0])
+
+    def enroll(self, email: str) -> Dict[str, str]:
+        """Create (or replace) a pending secret; it only takes effect after confirm()"""
+        secret = secrets.token_bytes(20)
+        # A current authenticator keeps working, and any lockout stays in place
+        self.conn.execute(
+            "INSERT INTO totp (email, secret, pending_secret, created_at) VALUES (?, X'', ?, ?)"
+            " ON CONFLICT (email) DO UPDATE SET pending_secret = excluded.pending_secret",
+            (email, self.fernet.encrypt(secret), time.time())
+        )
+        encoded = base64.b32encode(secret).decode().rstrip("=")
+        label = quote(f"{self.issuer}:{email}")
+        params = urlencode({"secret": encoded, "issuer": self.issuer, "digits": DIGITS, "period": PERIOD})
+        return {"secret": encoded, "otpauth_uri": f"otpauth://totp/{label}?{params}"}
+
+    def confirm(self, email: str, code: str) -> bool:
+        """Activate the pending secret with a first valid code, replacing any current one"""
+        return self._check(email, code, pending=True)
+
+    def verify(self, email: str, code: str) -> bool:
+        """Check a code for a confirmed enrollment"""
+        return self._check(email, code, pending=False)
+
+    def _check(self, email: str, code: str, pending: bool) -> bool:
+        now = time.time()
+        if pending:
+            query = "SELECT pending_secret, last_step, locked_until FROM totp WHERE email = ? AND pending_secret IS NOT NULL"
+        else:
+            query = "SELECT secret, last_step, locked_until FROM totp WHERE email = ? AND confirmed = 1"
+        row = self.conn.execute(query, (email,)).fetchone()
+        if row is None:
+            return False
+        if row[2] > now:
+            raise TOTPLockedOut(row[2] - now)
+        if not code.isdigit() or len(code) != DIGITS:
+            return self._record_failure(email, now)
+        stored = row[0]
+        try:
+            secret = self.primary.decrypt(stored)
+            current = stored
+        except InvalidToken:
+            try:
+                secret = self.fernet.decrypt(stored)
+            except InvalidToken:
+                return False
+            current = self.fernet.rotate(stored)  # stored under a previous key; move it to the current one
+
+        step = self._matching_step(secret, code)
+        if step is None:
+            return self._record_failure(email, now)
+        if pending:
+            # Matching on the pending secret keeps a concurrent re-enrollment intact; the
+            # accepted step is recorded so the confirmation code can't be replayed on verify
+            updated = self.conn.execute(
+                "UPDATE totp SET secret = ?, pending_secret = NULL, confirmed = 1, last_step = ?, failed_attempts = 0,"
+                " created_at = ? WHERE email = ? AND pending_secret = ? AND locked_until <= ?",
+                (current, step, now, email, stored, now)
+            )
+            if updated.rowcount != 1:
+                return self._record_failure(email, now)
+            return True
+        if step <= row[1]:
+            return self._record_failure(email, now)
+        # Replay guard: only one caller (in any worker) can advance past this step;
+        # matching on the stored secret also keeps a concurrent re-enrollment intact,
+        # and a lockout set by another worker in the meantime still applies
+        updated = self.conn.execute(
+            "UPDATE totp SET last_step = ?, secret = ?, failed_attempts = 0"
+            " WHERE email = ? AND last_step < ? AND secret = ? AND locked_until <= ?",
+            (step, current, email, step, stored, now)
+        )
+        if updated.rowcount != 1:
+            return self._record_failure(email, now)
+        return True
+
+    def _record_failure(self, email: str, now: float) -> bool:
+        """Count a wrong code; the one that reaches the limit starts the lockout (always returns False)"""
+        locked = self.conn.execute(
+            "UPDATE totp SET"
+            " failed_attempts = CASE WHEN failed_attempts + 1 >= ? THEN 0 ELSE failed_attempts + 1 END,"
+            " locked_until = CASE WHEN failed_attempts + 1 >= ? THEN ? ELSE locked_until END"
+            " WHERE email = ? AND locked_until <= ? RETURNING locked_until",
+            (self.max_failed_attempts, self.max_failed_attempts, now + self.lockout_seconds, email, now)
+        ).fetchall()
+        if locked and locked[0][0] > now:
+            if self.event_log is not None:
+                self.event_log.emit("totp_lockout", sub=email, failed_attempts=self.max_failed_attempts)
+            raise TOTPLockedOut(self.lockout_seconds)
+        return False
+
+    @staticmethod
+    def _matching_step(secret: bytes, code: str) -> Optional[int]:
+        now_step = int(time.time()) // PERIOD
+        for step in range(now_step - WINDOW, now_step + WINDOW + 1):
+            if hmac.compare_digest(hotp(secret, step), code):
+                return step
+        return None
@@ -1,21 +1,54 @@
 from twilio.rest import Client
-from twilio.base.exceptions import TwilioException
+from twilio.http.http_client import TwilioHttpClient
+from twilio.base.exceptions import TwilioException, TwilioRestException
 from typing import Optional, Dict
-from ..config import settings
+from ..config import Settings, settings
+from ..profiling import span
+from ..resilience import Upstream
 
 class TwilioVerifyProvider:
     def __init__(self):
-        self.client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+        self.client = self._create_client(settings)
         self.verify_service_sid = settings.TWILIO_VERIFY_SERVICE_SID
+        self.upstream = Upstream(
+            "twilio",
+            timeout=settings.TWILIO_TIMEOUT_SECONDS,
+            max_concurrency=settings.TWILIO_MAX_CONCURRENCY,
+            is_failure=self._is_upstream_failure
+        )
+    
+    @staticmethod
+    def _create_client(config) -> Client:
+        return Client(
+            config.TWILIO_ACCOUNT_SID,
+            config.TWILIO_AUTH_TOKEN,
+            http_client=TwilioHttpClient(timeout=config.TWILIO_TIMEOUT_SECONDS)
+        )
+    
+    def apply_settings(self, old: Settings, new: Settings):
+        """Reload hook: rotated credentials get a fresh client; in-flight calls keep the old one"""
+        if (new.TWILIO_ACCOUNT_SID, new.TWILIO_AUTH_TOKEN, new.TWILIO_TIMEOUT_SECONDS) != \
+                (old.TWILIO_ACCOUNT_SID, old.TWILIO_AUTH_TOKEN, old.TWILIO_TIMEOUT_SECONDS):
+            self.client = self._create_client(new)
+        self.verify_service_sid = new.TWILIO_VERIFY_SERVICE_SID
+        self.upstream.timeout = new.TWILIO_TIMEOUT_SECONDS
+    
+    @staticmethod
+    def _is_upstream_failure(exc: BaseException) -> bool:
+        """4xx responses (bad number, wrong code) are the caller's fault, not Twilio's"""
+        if isinstance(exc, TwilioRestException):
+            return exc.status >= 500
+        return True
         
     async def send_verification_code(self, phone_number: str) -> Dict[str, str]:
         """Send OTP verification code via SMS"""
         try:
-            verification = self.client.verify \
+            verifications = self.client.verify \
                 .v2 \
                 .services(self.verify_service_sid) \
-                .verifications \
-                .create(to=phone_number, channel='sms')
+                .verifications
+            with span("twilio_send"):
+                verification = await self.upstream.run_sync(verifications.create, to=phone_number, channel='sms')
             
             return {
                 "status": "sent",
@@ -32,11 +65,12 @@ class TwilioVerifyProvider:
     async def verify_code(self, phone_number: str, code: str) -> Dict[str, str]:
         """Verify the OTP code"""
         try:
-            verification_check = self.client.verify \
+            verification_checks = self.client.verify \
                 .v2 \
                 .services(self.verify_service_sid) \
-                .verification_checks \
-                .create(to=phone_number, code=code)
+                .verification_checks
+            with span("twilio_check"):
+                verification_check = await self.upstream.run_sync(verification_checks.create, to=phone_number, code=code)
             
             return {
                 "status": verification_check.status,  # "approved" or "pending"
@@ -53,11 +87,11 @@ class TwilioVerifyProvider:
     async def get_verification_status(self, phone_number: str) -> Optional[Dict]:
         """Get current verification status for a phone number"""
         try:
-            verifications = self.client.verify \
+            verification_list = self.client.verify \
                 .v2 \
                 .services(self.verify_service_sid) \
-                .verifications \
-                .list(to=phone_number, limit=1)
+                .verifications
+            verifications = await self.upstream.run_sync(verification_list.list, to=phone_number, limit=1)
             
             if verifications:
                 verification = verifications[0]
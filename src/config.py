@@ -1,44 +1,256 @@
+import asyncio
+import json
 import os
-from typing import List
+import signal
+from typing import Callable, Dict, List, Mapping, Optional
 
 class Settings:
-    # JWT Settings
-    JWT_SECRET_KEY: str = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-in-production")
-    JWT_ALGORITHM: str = "HS256"
-    ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
-    REFRESH_TOKEN_EXPIRE_DAYS: int = 7
-    
-    # Google OAuth Settings
-    GOOGLE_CLIENT_ID: str = os.getenv("GOOGLE_CLIENT_ID", "")
-    GOOGLE_CLIENT_SECRET: str = os.getenv("GOOGLE_CLIENT_SECRET", "")
-    GOOGLE_REDIRECT_URI: str = os.getenv("GOOGLE_REDIRECT_URI", "http://localhost:8000/auth/google/callback")
-    
-    # Twilio Settings
-    TWILIO_ACCOUNT_SID: str = os.getenv("TWILIO_ACCOUNT_SID", "")
-    TWILIO_AUTH_TOKEN: str = os.getenv("TWILIO_AUTH_TOKEN", "")
-    TWILIO_VERIFY_SERVICE_SID: str = os.getenv("TWILIO_VERIFY_SERVICE_SID", "")
-    
-    # Domain Validation
-    ALLOWED_DOMAINS: List[str] = os.getenv("ALLOWED_DOMAINS", "comma.cm,derozic.com").split(",")
-    
-    # CORS Settings
-    ALLOWED_ORIGINS: List[str] = [
-        "https://comma.cm",
-        "https://docs.comma.cm", 
-        "https://app.comma.cm",
-        "https://storybook.comma.cm",
-        "http://localhost:3000",
-        "http://localhost:8000",
-        "http://localhost:8080"
-    ]
-    
-    # Apple OAuth (future)
-    APPLE_CLIENT_ID: str = os.getenv("APPLE_CLIENT_ID", "")
-    APPLE_TEAM_ID: str = os.getenv("APPLE_TEAM_ID", "")
-    APPLE_KEY_ID: str = os.getenv("APPLE_KEY_ID", "")
-    
-    # Microsoft OAuth (future)  
-    MICROSOFT_CLIENT_ID: str = os.getenv("MICROSOFT_CLIENT_ID", "")
-    MICROSOFT_CLIENT_SECRET: str = os.getenv("MICROSOFT_CLIENT_SECRET", "")
+    """One immutable-by-convention snapshot of configuration; see SettingsProvider"""
+    
+    def __init__(self, env: Mapping[str, str] = os.environ, version: int = 0):
+        self.version = version
+        
+        # JWT Settings
+        self.JWT_SECRET_KEY: str = env.get("JWT_SECRET_KEY", "your-secret-key-change-in-production")
+        self.JWT_PREVIOUS_SECRET_KEY: str = env.get("JWT_PREVIOUS_SECRET_KEY", "")  # still accepted while rotating
+        self.JWT_ALGORITHM: str = "HS256"
+        self.ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+        self.REFRESH_TOKEN_EXPIRE_DAYS: int = 7
+        
+        # Shared-memory verification cache for multi-worker hosts (empty path disables)
+        self.SHARED_VERIFY_CACHE_PATH: str = env.get("SHARED_VERIFY_CACHE_PATH", "")  # e.g. /dev/shm/comma-auth-verify.cache
+        self.SHARED_VERIFY_CACHE_SLOTS: int = int(env.get("SHARED_VERIFY_CACHE_SLOTS", "65536"))
+        
+        # Unix-socket verification sidecar for co-located apps (empty path disables; restart to change)
+        self.VERIFY_SOCKET_PATH: str = env.get("VERIFY_SOCKET_PATH", "")  # e.g. /run/comma-auth/verify.sock
+        self.VERIFY_SOCKET_PERMISSIONS: int = int(env.get("VERIFY_SOCKET_PERMISSIONS", "660"), 8)
+        
+        # Token exchange (service-to-service, RFC 8693)
+        self.TOKEN_EXCHANGE_AUDIENCES: List[str] = [a for a in env.get("TOKEN_EXCHANGE_AUDIENCES", "comma-api").split(",") if a]
+        self.TOKEN_EXCHANGE_EXPIRE_MINUTES: int = int(env.get("TOKEN_EXCHANGE_EXPIRE_MINUTES", "5"))
+        self.TOKEN_EXCHANGE_CACHE_SIZE: int = int(env.get("TOKEN_EXCHANGE_CACHE_SIZE", "10000"))
+        
+        # Google OAuth Settings
+        self.GOOGLE_CLIENT_ID: str = env.get("GOOGLE_CLIENT_ID", "")
+        self.GOOGLE_CLIENT_SECRET: str = env.get("GOOGLE_CLIENT_SECRET", "")
+        self.GOOGLE_REDIRECT_URI: str = env.get("GOOGLE_REDIRECT_URI", "http://localhost:8000/auth/google/callback")
+        
+        # Google Workspace directory (scopes from group / org unit membership)
+        # Rules map "group:<email>" or "orgunit:<path>" to scopes; empty disables the lookup
+        self.GOOGLE_DIRECTORY_URL: str = env.get("GOOGLE_DIRECTORY_URL", "https://admin.googleapis.com/admin/directory/v1")
+        self.GOOGLE_DIRECTORY_CREDENTIALS_FILE: str = env.get("GOOGLE_DIRECTORY_CREDENTIALS_FILE", "")  # service account with domain-wide delegation
+        self.GOOGLE_DIRECTORY_ADMIN_EMAIL: str = env.get("GOOGLE_DIRECTORY_ADMIN_EMAIL", "")
+        self.DIRECTORY_SCOPE_RULES: Dict[str, List[str]] = json.loads(env.get("DIRECTORY_SCOPE_RULES") or "{}")
+        self.DIRECTORY_DEFAULT_SCOPES: List[str] = env.get("DIRECTORY_DEFAULT_SCOPES", "read").split(",")
+        self.DIRECTORY_CACHE_TTL_SECONDS: float = float(env.get("DIRECTORY_CACHE_TTL_SECONDS", "300"))
+        self.DIRECTORY_NEGATIVE_TTL_SECONDS: float = float(env.get("DIRECTORY_NEGATIVE_TTL_SECONDS", "60"))
+        self.DIRECTORY_REFRESH_SECONDS: float = float(env.get("DIRECTORY_REFRESH_SECONDS", "240"))
+        
+        # Twilio Settings
+        self.TWILIO_ACCOUNT_SID: str = env.get("TWILIO_ACCOUNT_SID", "")
+        self.TWILIO_AUTH_TOKEN: str = env.get("TWILIO_AUTH_TOKEN", "")
+        self.TWILIO_VERIFY_SERVICE_SID: str = env.get("TWILIO_VERIFY_SERVICE_SID", "")
+        
+        # Diagnostics: Server-Timing spans, slow-request buffer, event-loop stall monitor
+        self.SERVER_TIMING_ENABLED: bool = env.get("SERVER_TIMING_ENABLED", "false").lower() == "true"  # spans are internal; dev only
+        self.SLOW_REQUEST_THRESHOLD_MS: float = float(env.get("SLOW_REQUEST_THRESHOLD_MS", "500"))
+        self.SLOW_REQUEST_BUFFER_SIZE: int = int(env.get("SLOW_REQUEST_BUFFER_SIZE", "100"))
+        self.LOOP_LAG_THRESHOLD_MS: float = float(env.get("LOOP_LAG_THRESHOLD_MS", "100"))
+        self.PROFILE_MAX_SECONDS: float = float(env.get("PROFILE_MAX_SECONDS", "60"))
+        
+        # Upstream resilience (timeouts in seconds, 0 disables hedging)
+        self.UPSTREAM_REQUEST_DEADLINE_SECONDS: float = float(env.get("UPSTREAM_REQUEST_DEADLINE_SECONDS", "10"))
+        self.GOOGLE_TIMEOUT_SECONDS: float = float(env.get("GOOGLE_TIMEOUT_SECONDS", "5"))
+        self.GOOGLE_MAX_CONCURRENCY: int = int(env.get("GOOGLE_MAX_CONCURRENCY", "50"))
+        self.GOOGLE_HEDGE_AFTER_SECONDS: float = float(env.get("GOOGLE_HEDGE_AFTER_SECONDS", "0.5"))
+        self.MICROSOFT_TIMEOUT_SECONDS: float = float(env.get("MICROSOFT_TIMEOUT_SECONDS", "5"))
+        self.MICROSOFT_MAX_CONCURRENCY: int = int(env.get("MICROSOFT_MAX_CONCURRENCY", "50"))
+        self.TWILIO_TIMEOUT_SECONDS: float = float(env.get("TWILIO_TIMEOUT_SECONDS", "5"))
+        self.TWILIO_MAX_CONCURRENCY: int = int(env.get("TWILIO_MAX_CONCURRENCY", "20"))
+        
+        # Admission control (verify-class vs login-class routes)
+        self.VERIFY_MAX_CONCURRENCY: int = int(env.get("VERIFY_MAX_CONCURRENCY", "200"))
+        self.VERIFY_MAX_QUEUE: int = int(env.get("VERIFY_MAX_QUEUE", "1000"))
+        self.VERIFY_QUEUE_TIMEOUT_SECONDS: float = float(env.get("VERIFY_QUEUE_TIMEOUT_SECONDS", "0.5"))
+        self.LOGIN_MAX_CONCURRENCY: int = int(env.get("LOGIN_MAX_CONCURRENCY", "50"))
+        self.LOGIN_MAX_QUEUE: int = int(env.get("LOGIN_MAX_QUEUE", "100"))
+        self.LOGIN_QUEUE_TIMEOUT_SECONDS: float = float(env.get("LOGIN_QUEUE_TIMEOUT_SECONDS", "2"))
+        self.ADMISSION_RETRY_AFTER_SECONDS: int = int(env.get("ADMISSION_RETRY_AFTER_SECONDS", "1"))
+        
+        # Audit log ("jsonl", "sqlite" or "none")
+        self.AUDIT_LOG_SINK: str = env.get("AUDIT_LOG_SINK", "jsonl")
+        self.AUDIT_LOG_PATH: str = env.get("AUDIT_LOG_PATH", "logs/audit.jsonl")
+        self.AUDIT_LOG_MAX_BYTES: int = int(env.get("AUDIT_LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+        self.AUDIT_LOG_BACKUP_COUNT: int = int(env.get("AUDIT_LOG_BACKUP_COUNT", "10"))
+        self.AUDIT_LOG_BUFFER_SIZE: int = int(env.get("AUDIT_LOG_BUFFER_SIZE", "10000"))
+        self.AUDIT_LOG_BATCH_SIZE: int = int(env.get("AUDIT_LOG_BATCH_SIZE", "500"))
+        self.AUDIT_LOG_FLUSH_INTERVAL_SECONDS: float = float(env.get("AUDIT_LOG_FLUSH_INTERVAL_SECONDS", "1"))
+        
+        # SSO session cookie (shared by all properties under the parent domain)
+        self.SESSION_COOKIE_NAME: str = env.get("SESSION_COOKIE_NAME", "comma_session")
+        self.SESSION_COOKIE_DOMAIN: str = env.get("SESSION_COOKIE_DOMAIN", ".comma.cm")  # empty = host-only (localhost)
+        self.SESSION_COOKIE_SECURE: bool = env.get("SESSION_COOKIE_SECURE", "true").lower() == "true"
+        self.SESSION_TTL_HOURS: int = int(env.get("SESSION_TTL_HOURS", "12"))
+        self.SESSION_STORE: str = env.get("SESSION_STORE", "sqlite")  # sqlite (shared by workers) | memory (single worker)
+        self.SESSION_STORE_PATH: str = env.get("SESSION_STORE_PATH", "data/sessions.db")
+        
+        # Local TOTP second factor
+        self.TOTP_ENCRYPTION_KEY: str = env.get("TOTP_ENCRYPTION_KEY", "")  # Fernet key for secrets at rest; empty disables TOTP
+        self.TOTP_PREVIOUS_ENCRYPTION_KEYS: List[str] = [k for k in env.get("TOTP_PREVIOUS_ENCRYPTION_KEYS", "").split(",") if k]
+        self.TOTP_STORE_PATH: str = env.get("TOTP_STORE_PATH", "data/totp.db")
+        self.TOTP_ISSUER: str = env.get("TOTP_ISSUER", "Comma")
+        self.TOTP_MAX_FAILED_ATTEMPTS: int = int(env.get("TOTP_MAX_FAILED_ATTEMPTS", "5"))  # then locked out, like Twilio Verify
+        self.TOTP_LOCKOUT_SECONDS: float = float(env.get("TOTP_LOCKOUT_SECONDS", "900"))
+        
+        # Domain Validation
+        self.ALLOWED_DOMAINS: List[str] = env.get("ALLOWED_DOMAINS", "comma.cm,derozic.com").split(",")
+        
+        # CORS Settings
+        self.ALLOWED_ORIGINS: List[str] = env.get("ALLOWED_ORIGINS", ",".join([
+            "https://comma.cm",
+            "https://docs.comma.cm", 
+            "https://app.comma.cm",
+            "https://storybook.comma.cm",
+            "http://localhost:3000",
+            "http://localhost:8000",
+            "http://localhost:8080"
+        ])).split(",")
+        
+        # Apple OAuth (future)
+        self.APPLE_CLIENT_ID: str = env.get("APPLE_CLIENT_ID", "")
+        self.APPLE_TEAM_ID: str = env.get("APPLE_TEAM_ID", "")
+        self.APPLE_KEY_ID: str = env.get("APPLE_KEY_ID", "")
+        
+        # Microsoft OAuth (future)  
+        self.MICROSOFT_CLIENT_ID: str = env.get("MICROSOFT_CLIENT_ID", "")
+        self.MICROSOFT_CLIENT_SECRET: str = env.get("MICROSOFT_CLIENT_SECRET", "")
+
+
+def read_config_file(path: str) -> Dict[str, str]:
+    """Parse a dotenv-style KEY=VALUE file (same format as .env.example)"""
+    values: Dict[str, str] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#") or "=" not in line:
+                continue
+            key, value = line.split("=", 1)
+            values[key.strip()] = value.strip().strip('"').strip("'")
+    return values
+
+class SettingsProvider:
+    """
+    Holds the current Settings snapshot behind a single reference.
+    
+    Readers just dereference `current` (no locks); reload() builds a complete
+    new snapshot from the environment overlaid with COMMA_AUTH_CONFIG_FILE and
+    swaps it in one assignment, then notifies subscribers so components that
+    derive state from settings (signing keys, clients, caches) can rebuild it.
+    Reloads are triggered by SIGHUP or by the config file's mtime changing.
+    """
+    
+    def __init__(self, config_file: str = "", poll_interval: float = 5.0):
+        self.config_file = config_file
+        self.poll_interval = poll_interval
+        self._mtime = self._file_mtime()
+        self.current = Settings(self._environment())
+        self._subscribers: List[Callable[[Settings, Settings], None]] = []
+        self._watch_task: Optional[asyncio.Task] = None
+        self.reloads = 0
+        self.reload_errors = 0
+        self.last_error: Optional[str] = None
+    
+    def _file_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.config_file).st_mtime if self.config_file else None
+        except OSError:
+            return None
+    
+    def _environment(self) -> Dict[str, str]:
+        env = dict(os.environ)
+        if self.config_file and os.path.exists(self.config_file):
+            env.update(read_config_file(self.config_file))
+        return env
+    
+    def subscribe(self, callback: Callable[[Settings, Settings], None]):
+        """Call `callback(old, new)` after every successful reload"""
+        self._subscribers.append(callback)
+    
+    def reload(self) -> bool:
+        """Build and swap in a new snapshot; on error keep serving the old one"""
+        old = self.current
+        try:
+            new = Settings(self._environment(), version=old.version + 1)
+        except (OSError, ValueError) as e:
+            self.reload_errors += 1
+            self.last_error = str(e)
+            return False
+        self.current = new
+        self.reloads += 1
+        for callback in self._subscribers:
+            try:
+                callback(old, new)
+            except Exception as e:
+                # One component failing to apply a value must not stop the others
+                self.reload_errors += 1
+                self.last_error = f"{getattr(callback, '__qualname__', callback)}: {e}"
+        return True
+    
+    async def start(self):
+        """Install the SIGHUP handler and start watching the config file"""
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(signal.SIGHUP, self.reload)
+        except (NotImplementedError, RuntimeError, ValueError):
+            pass  # no signals here (e.g. not the main thread); the file watcher still works
+        if self.config_file and self._watch_task is None:
+            self._watch_task = asyncio.create_task(self._watch())
+    
+    async def stop(self):
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+    
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            mtime = self._file_mtime()
+            if mtime != self._mtime:
+                self._mtime = mtime
+                self.reload()
+    
+    def snapshot(self) -> Dict:
+        return {
+            "version": self.current.version,
+            "config_file": self.config_file or None,
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+            "last_error": self.last_error,
+        }
+
+class LiveSettings:
+    """
+    Module-level `settings` object: every attribute read goes to the provider's
+    current snapshot, so existing `settings.X` call sites see reloads live.
+    Code that needs several values from one consistent version should take
+    `settings_provider.current` once and read from that.
+    """
+    
+    def __init__(self, provider: SettingsProvider):
+        object.__setattr__(self, "_provider", provider)
+    
+    def __getattr__(self, name):
+        return getattr(self._provider.current, name)
+    
+    def __setattr__(self, name, value):
+        setattr(self._provider.current, name, value)
 
-settings = Settings()
\ No newline at end of file
+settings_provider = SettingsProvider(
+    config_file=os.getenv("COMMA_AUTH_CONFIG_FILE", ""),
+    poll_interval=float(os.getenv("COMMA_AUTH_CONFIG_POLL_SECONDS", "5"))
+)
+settings = LiveSettings(settings_provider)
@@ -0,0 +1,185 @@
+"""
+Asynchronous audit/event log
+
+Handlers call `event_log.emit(...)`, which only appends a small tuple to a
+bounded in-memory ring buffer. A background task drains the buffer in
+batches and hands them to a sink (rotating JSONL files or SQLite) on a
+worker thread, so disk I/O never runs on the request path. If the sink
+falls behind and the buffer fills, the oldest events are overwritten and
+counted as dropped.
+"""
+
+import asyncio
+import fcntl
+import json
+import os
+import sqlite3
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+Event = Tuple[float, str, Dict[str, Any]]
+
+
+class JSONLSink:
+    """
+    Append-only JSONL file rotated by size (audit.jsonl -> audit.jsonl.1 ...).
+    Every worker on the host shares the file; an flock on `<path>.lock` around
+    append + rotate keeps them from rotating the same file twice.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 50 * 1024 * 1024, backup_count: int = 10):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.rotate_errors = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock_fd = os.open(f"{path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+
+    def write(self, batch: List[Event]):
+        lines = "".join(
+            json.dumps({"ts": ts, "type": event_type, **fields}, separators=(",", ":"), default=str) + "\n"
+            for ts, event_type, fields in batch
+        )
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            # Reopened under the lock, so a rotation by another worker is always seen
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(lines)
+                size = f.tell()
+            if size >= self.max_bytes:
+                try:
+                    self._rotate()
+                except OSError:
+                    # The batch is already on disk; a failed rotation must not count it as dropped
+                    self.rotate_errors += 1
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _rotate(self):
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def close(self):
+        os.close(self._lock_fd)
+
+
+class SQLiteSink:
+    """Batch inserts into a single `events` table"""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Only ever used from the flush thread, one batch at a time
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS events (ts REAL NOT NULL, type TEXT NOT NULL, data TEXT NOT NULL)"
+        )
+        self.conn.commit()
+
+    def write(self, batch: List[Event]):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO events (ts, type, data) VALUES (?, ?, ?)",
+                [(ts, event_type, json.dumps(fields, default=str)) for ts, event_type, fields in batch]
+            )
+
+    def close(self):
+        self.conn.close()
+
+
+class EventLog:
+    def __init__(self, sink=None, capacity: int = 10000, batch_size: int = 500, flush_interval: float = 1.0):
+        self.sink = sink
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer: Deque[Event] = deque(maxlen=capacity)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.emitted = 0
+        self.dropped = 0
+        self.written = 0
+        self.write_errors = 0
+        self.last_flush_ms = 0.0
+
+    def emit(self, event_type: str, **fields):
+        """Record an event; never blocks and never raises into the handler"""
+        if self.sink is None:
+            return
+        if len(self._buffer) == self.capacity:
+            self.dropped += 1  # deque(maxlen) evicts the oldest entry
+        self._buffer.append((time.time(), event_type, fields))
+        self.emitted += 1
+        if self._wakeup is not None and len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    async def start(self):
+        if self.sink is None or self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flusher and write out whatever is still buffered"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        while self._buffer:
+            await self._flush_batch()
+        await asyncio.to_thread(self.sink.close)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            while self._buffer:
+                await self._flush_batch()
+
+    async def _flush_batch(self):
+        batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+        started = time.perf_counter()
+        try:
+            await asyncio.to_thread(self.sink.write, batch)
+            self.written += len(batch)
+        except Exception:
+            # Losing a batch beats wedging the flusher; the counters make it visible
+            self.write_errors += 1
+            self.dropped += len(batch)
+        self.last_flush_ms = round((time.perf_counter() - started) * 1000, 3)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.sink is not None,
+            "buffered": len(self._buffer),
+            "capacity": self.capacity,
+            "emitted": self.emitted,
+            "written": self.written,
+            "dropped": self.dropped,
+            "write_errors": self.write_errors,
+            "rotate_errors": getattr(self.sink, "rotate_errors", 0),
+            "last_flush_ms": self.last_flush_ms,
+        }
+
+
+def create_sink(kind: str, path: str, max_bytes: int, backup_count: int):
+    """Build the configured sink; 'none' disables the audit log"""
+    if kind == "jsonl":
+        return JSONLSink(path, max_bytes=max_bytes, backup_count=backup_count)
+    if kind == "sqlite":
+        return SQLiteSink(path)
+    if kind == "none":
+        return None
+    raise ValueError(f"Unknown AUDIT_LOG_SINK: {kind}")
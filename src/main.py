@@ -1,25 +1,106 @@
-from fastapi import FastAPI, HTTPException, Depends, status, Request
+from fastapi import FastAPI, HTTPException, Depends, status, Request, Response, Form
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+import asyncio
 import secrets
+import threading
+import time
 import uuid
-from typing import Dict
-from .config import settings
-from .models import TokenResponse, OTPRequest, OTPVerification, TokenValidation, AuthState
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+from .config import settings, settings_provider
+from .models import (
+    TokenResponse, OTPRequest, OTPVerification, TokenValidation, AuthState, TokenExchangeResponse,
+    TOTPEnrollment, TOTPConfirmation
+)
 from .auth.google import GoogleAuthProvider
+from .auth.google_directory import GoogleDirectory
 from .auth.twilio_verify import TwilioVerifyProvider  
-from .auth.jwt_manager import JWTManager
+from .auth.totp import TOTPLockedOut, TOTPProvider
+from .auth.jwt_manager import JWTManager, TokenExchangeError
+from .resilience import UpstreamUnavailable, deadline
+from .admission import AdmissionControlMiddleware, AdmissionPool
+from .events import EventLog, create_sink
+from .sessions import create_session_store
+from .sidecar import VerificationSidecar
+from .profiling import LoopLagMonitor, SamplingProfiler, TimingMiddleware, span
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await settings_provider.start()
+    await loop_lag.start()
+    await event_log.start()
+    await google_directory.start()
+    if verify_sidecar is not None:
+        await verify_sidecar.start()
+    yield
+    if verify_sidecar is not None:
+        await verify_sidecar.stop()
+    await google_directory.stop()
+    await event_log.stop()
+    await loop_lag.stop()
+    await settings_provider.stop()
 
 app = FastAPI(
     title="Comma Central Auth Service",
     description="Centralized authentication for all CMYK properties",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
+)
+
+# Admission control: separate pools so login floods can't starve /auth/verify
+admission_pools = {
+    "verify": AdmissionPool(
+        "verify",
+        max_concurrency=settings.VERIFY_MAX_CONCURRENCY,
+        max_queue=settings.VERIFY_MAX_QUEUE,
+        queue_timeout=settings.VERIFY_QUEUE_TIMEOUT_SECONDS
+    ),
+    "login": AdmissionPool(
+        "login",
+        max_concurrency=settings.LOGIN_MAX_CONCURRENCY,
+        max_queue=settings.LOGIN_MAX_QUEUE,
+        queue_timeout=settings.LOGIN_QUEUE_TIMEOUT_SECONDS
+    ),
+}
+app.add_middleware(
+    AdmissionControlMiddleware,
+    pools=admission_pools,
+    routes=[
+        ("/auth/verify", "verify"),
+        # Service-to-service on the request path of downstream apps, like verify
+        ("/auth/token/exchange", "verify"),
+        # Token issuance for browsers; a page-load storm must not starve verify
+        ("/auth/session/token", "login"),
+        ("/auth/google", "login"),
+        ("/auth/otp", "login"),
+        ("/auth/totp", "login"),
+        ("/auth/refresh", "login"),
+        ("/auth/apple", "login"),
+        ("/auth/microsoft", "login"),
+    ],
+    retry_after=settings.ADMISSION_RETRY_AFTER_SECONDS
 )
 
-# CORS middleware
+# Span timing outside admission so queueing counts toward the total
+slow_requests = deque(maxlen=settings.SLOW_REQUEST_BUFFER_SIZE)
 app.add_middleware(
-    CORSMiddleware,
+    TimingMiddleware,
+    slow_requests=slow_requests,
+    slow_threshold_ms=lambda: settings.SLOW_REQUEST_THRESHOLD_MS,
+    enabled=lambda: settings.SERVER_TIMING_ENABLED
+)
+
+# CORS middleware (added last so it wraps shed responses too)
+class LiveCORSMiddleware(CORSMiddleware):
+    """CORS that checks the current ALLOWED_ORIGINS, so a reload takes effect immediately"""
+    def is_allowed_origin(self, origin: str) -> bool:
+        return origin in settings.ALLOWED_ORIGINS
+
+app.add_middleware(
+    LiveCORSMiddleware,
     allow_origins=settings.ALLOWED_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
@@ -28,12 +109,76 @@ app.add_middleware(
 
 # Initialize providers
 google_auth = GoogleAuthProvider()
+google_directory = GoogleDirectory()
 twilio_verify = TwilioVerifyProvider()
 jwt_manager = JWTManager()
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
+event_log = EventLog(
+    create_sink(
+        settings.AUDIT_LOG_SINK,
+        settings.AUDIT_LOG_PATH,
+        max_bytes=settings.AUDIT_LOG_MAX_BYTES,
+        backup_count=settings.AUDIT_LOG_BACKUP_COUNT
+    ),
+    capacity=settings.AUDIT_LOG_BUFFER_SIZE,
+    batch_size=settings.AUDIT_LOG_BATCH_SIZE,
+    flush_interval=settings.AUDIT_LOG_FLUSH_INTERVAL_SECONDS
+)
+totp = TOTPProvider(event_log=event_log)
+
+# Optional binary verification endpoint for apps on the same host (see sidecar.py)
+verify_sidecar = VerificationSidecar(
+    settings.VERIFY_SOCKET_PATH,
+    verify=jwt_manager.verify_token,
+    event_log=event_log,
+    permissions=settings.VERIFY_SOCKET_PERMISSIONS
+) if settings.VERIFY_SOCKET_PATH else None
+
+loop_lag = LoopLagMonitor(threshold_ms=settings.LOOP_LAG_THRESHOLD_MS)
+profiler = SamplingProfiler()
 
 # In-memory state storage (use Redis in production)
 auth_states: Dict[str, AuthState] = {}
+# SSO sessions; the default SQLite store is shared by every worker on the host
+sessions = create_session_store(settings.SESSION_STORE, settings.SESSION_STORE_PATH, ttl_hours=settings.SESSION_TTL_HOURS)
+
+def set_session_cookie(response: Response, session_id: str):
+    """Session cookie shared by every property under the parent domain"""
+    response.set_cookie(
+        settings.SESSION_COOKIE_NAME,
+        session_id,
+        max_age=settings.SESSION_TTL_HOURS * 3600,
+        domain=settings.SESSION_COOKIE_DOMAIN or None,
+        secure=settings.SESSION_COOKIE_SECURE,
+        httponly=True,
+        samesite="lax"
+    )
+
+upstreams = [google_auth.upstream, google_directory.upstream, twilio_verify.upstream]
+
+# Hot reload (SIGHUP or COMMA_AUTH_CONFIG_FILE changing). Pool sizes, the audit log
+# and session TTL are wired up once above and only change on restart.
+for component in (jwt_manager, google_auth, google_directory, twilio_verify, totp):
+    settings_provider.subscribe(component.apply_settings)
+
+@app.exception_handler(UpstreamUnavailable)
+async def upstream_unavailable_handler(request: Request, exc: UpstreamUnavailable):
+    """Fail fast with 503 instead of letting callers wait on a sick provider"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"{exc.upstream} is temporarily unavailable ({exc.reason})"},
+        headers={"Retry-After": "5"}
+    )
+
+@app.exception_handler(TOTPLockedOut)
+async def totp_locked_out_handler(request: Request, exc: TOTPLockedOut):
+    """Too many wrong TOTP codes (verify or confirm); the lockout is logged as totp_lockout"""
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Too many failed verification attempts"},
+        headers={"Retry-After": str(int(exc.retry_after) + 1)}
+    )
 
 @app.get("/")
 async def root():
@@ -41,7 +186,37 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "service": "comma-auth"}
+    upstream_states = {upstream.name: upstream.snapshot() for upstream in upstreams}
+    degraded = any(state["state"] != "closed" for state in upstream_states.values())
+    return {
+        "status": "degraded" if degraded else "healthy",
+        "service": "comma-auth",
+        "upstreams": upstream_states
+    }
+
+# Operational endpoints expose internal state: admin tokens (after 2FA) only
+def require_admin(credentials: HTTPAuthorizationCredentials = Depends(security)) -> TokenValidation:
+    token_validation = jwt_manager.verify_token(credentials.credentials)
+    if not token_validation.valid:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    if "admin" not in token_validation.scopes or token_validation.requires_2fa:
+        raise HTTPException(status_code=403, detail="Admin scope required")
+    return token_validation
+
+@app.get("/metrics")
+async def metrics(admin: TokenValidation = Depends(require_admin)):
+    return {
+        "admission": {name: pool.snapshot() for name, pool in admission_pools.items()},
+        "upstreams": {upstream.name: upstream.snapshot() for upstream in upstreams},
+        "audit_log": event_log.snapshot(),
+        "sessions": len(sessions),
+        "token_exchange_cache": jwt_manager.exchange_cache.snapshot(),
+        "shared_verify_cache": jwt_manager.verify_cache.snapshot() if jwt_manager.verify_cache else None,
+        "directory": google_directory.snapshot(),
+        "config": settings_provider.snapshot(),
+        "verify_socket": verify_sidecar.snapshot() if verify_sidecar else None,
+        "event_loop": loop_lag.snapshot()
+    }
 
 # Google OAuth Flow
 @app.get("/auth/google")
@@ -58,7 +233,7 @@ async def google_login(redirect_url: str = None):
     return {"authorization_url": authorization_url, "state": state}
 
 @app.get("/auth/google/callback")
-async def google_callback(code: str, state: str):
+async def google_callback(code: str, state: str, response: Response):
     """Handle Google OAuth callback"""
     if state not in auth_states:
         raise HTTPException(status_code=400, detail="Invalid state parameter")
@@ -66,25 +241,33 @@ async def google_callback(code: str, state: str):
     auth_state = auth_states.pop(state)
     
     try:
-        # Exchange code for token
-        token_data = await google_auth.exchange_code_for_token(code, state)
-        access_token = token_data.get("access_token")
-        
-        if not access_token:
-            raise HTTPException(status_code=400, detail="Failed to get access token")
-        
-        # Get user info
-        user_info = await google_auth.get_user_info(access_token)
+        # Both upstream calls share one deadline so a brownout fails fast
+        with deadline(settings.UPSTREAM_REQUEST_DEADLINE_SECONDS):
+            # Exchange code for token
+            token_data = await google_auth.exchange_code_for_token(code, state)
+            access_token = token_data.get("access_token")
+            
+            if not access_token:
+                raise HTTPException(status_code=400, detail="Failed to get access token")
+            
+            # Get user info
+            user_info = await google_auth.get_user_info(access_token)
         if not user_info:
             raise HTTPException(status_code=400, detail="Failed to get user info or invalid domain")
         
         # Create JWT tokens
-        jwt_access_token = jwt_manager.create_access_token(
-            user_info, 
-            scopes=auth_state.scopes,
-            requires_2fa=True  # Require 2FA for sensitive operations
-        )
-        refresh_token = jwt_manager.create_refresh_token(user_info.email)
+        with span("jwt_encode"):
+            jwt_access_token = jwt_manager.create_access_token(
+                user_info, 
+                scopes=auth_state.scopes,
+                requires_2fa=True  # Require 2FA for sensitive operations
+            )
+            refresh_token = jwt_manager.create_refresh_token(user_info.email)
+        event_log.emit("login", sub=user_info.email, provider="google")
+        event_log.emit("token_issued", sub=user_info.email, scopes=auth_state.scopes, two_factor=False)
+        session_id = sessions.create(user_info, auth_state.scopes)
+        # Resolve directory scopes now so OTP verification doesn't wait on them
+        google_directory.prefetch(user_info.email)
         
         response_data = TokenResponse(
             access_token=jwt_access_token,
@@ -95,12 +278,17 @@ async def google_callback(code: str, state: str):
         
         # Redirect to original URL if provided
         if auth_state.redirect_url:
-            return RedirectResponse(
+            redirect = RedirectResponse(
                 url=f"{auth_state.redirect_url}?token={jwt_access_token}&requires_2fa=true"
             )
+            set_session_cookie(redirect, session_id)
+            return redirect
         
+        set_session_cookie(response, session_id)
         return response_data
         
+    except UpstreamUnavailable:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Authentication failed: {str(e)}")
 
@@ -116,16 +304,21 @@ async def send_otp(
     if not token_validation.valid:
         raise HTTPException(status_code=401, detail="Invalid token")
     
-    result = await twilio_verify.send_verification_code(otp_request.phone_number)
+    with deadline(settings.UPSTREAM_REQUEST_DEADLINE_SECONDS):
+        result = await twilio_verify.send_verification_code(otp_request.phone_number)
     
     if result.get("status") == "error":
+        event_log.emit("otp_send", sub=token_validation.user_info.email, ok=False)
         raise HTTPException(status_code=400, detail=result.get("message"))
     
+    event_log.emit("otp_send", sub=token_validation.user_info.email, ok=True)
     return {"status": "sent", "message": "Verification code sent"}
 
 @app.post("/auth/otp/verify")
 async def verify_otp(
     otp_verification: OTPVerification,
+    request: Request,
+    response: Response,
     credentials: HTTPAuthorizationCredentials = Depends(security)
 ):
     """Verify OTP code and upgrade token"""
@@ -134,19 +327,48 @@ async def verify_otp(
     if not token_validation.valid:
         raise HTTPException(status_code=401, detail="Invalid token")
     
-    result = await twilio_verify.verify_code(
-        otp_verification.phone_number, 
-        otp_verification.code
-    )
+    if otp_verification.method == "totp":
+        require_totp()
+        # Checked in-process; no upstream round trip
+        with span("totp_check"):
+            valid = totp.verify(token_validation.user_info.email, otp_verification.code)
+    elif otp_verification.method == "sms":
+        if not otp_verification.phone_number:
+            raise HTTPException(status_code=400, detail="phone_number is required for SMS verification")
+        with deadline(settings.UPSTREAM_REQUEST_DEADLINE_SECONDS):
+            result = await twilio_verify.verify_code(
+                otp_verification.phone_number, 
+                otp_verification.code
+            )
+        valid = bool(result.get("valid"))
+    else:
+        raise HTTPException(status_code=400, detail="Unsupported verification method")
     
-    if not result.get("valid"):
+    if not valid:
+        event_log.emit("otp_verify", sub=token_validation.user_info.email, method=otp_verification.method, ok=False)
         raise HTTPException(status_code=400, detail="Invalid verification code")
     
+    # Full permissions after 2FA, narrowed by Workspace group / org unit when configured
+    with span("directory_scopes"):
+        scopes = await google_directory.scopes_for(
+            token_validation.user_info.email,
+            fallback=["read", "write", "admin"]
+        )
+    
     # Create enhanced token with 2FA completed
-    enhanced_token = jwt_manager.create_2fa_token(
-        token_validation.user_info,
-        scopes=["read", "write", "admin"]  # Full permissions after 2FA
+    with span("jwt_encode"):
+        enhanced_token = jwt_manager.create_2fa_token(token_validation.user_info, scopes=scopes)
+    event_log.emit("otp_verify", sub=token_validation.user_info.email, method=otp_verification.method, ok=True)
+    event_log.emit("token_issued", sub=token_validation.user_info.email, scopes=scopes, two_factor=True)
+    
+    # Upgrade the SSO session so other properties get 2FA tokens silently too
+    session_id = sessions.elevate(
+        request.cookies.get(settings.SESSION_COOKIE_NAME),
+        token_validation.user_info.email,
+        scopes=scopes
     )
+    if session_id:
+        set_session_cookie(response, session_id)
     
     return TokenResponse(
         access_token=enhanced_token,
@@ -155,6 +377,44 @@ async def verify_otp(
         requires_2fa=False
     )
 
+# TOTP enrollment (authenticator apps)
+def require_totp():
+    if not totp.enabled:
+        raise HTTPException(status_code=503, detail="TOTP is not configured on this server")
+
+@app.post("/auth/totp/enroll", response_model=TOTPEnrollment)
+async def totp_enroll(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Start TOTP enrollment; returns the secret and an otpauth:// URI for a QR code"""
+    require_totp()
+    token_validation = jwt_manager.verify_token(credentials.credentials)
+    if not token_validation.valid:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    
+    email = token_validation.user_info.email
+    # Replacing an active authenticator needs a token that already passed 2FA
+    if token_validation.requires_2fa and totp.is_enrolled(email):
+        raise HTTPException(status_code=403, detail="Complete 2FA before re-enrolling")
+    
+    event_log.emit("totp_enroll", sub=email)
+    return TOTPEnrollment(**totp.enroll(email))
+
+@app.post("/auth/totp/confirm")
+async def totp_confirm(
+    confirmation: TOTPConfirmation,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Activate a pending TOTP enrollment with the first code from the authenticator"""
+    require_totp()
+    token_validation = jwt_manager.verify_token(credentials.credentials)
+    if not token_validation.valid:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    
+    if not totp.confirm(token_validation.user_info.email, confirmation.code):
+        raise HTTPException(status_code=400, detail="Invalid verification code")
+    
+    event_log.emit("totp_confirm", sub=token_validation.user_info.email)
+    return {"status": "enrolled", "message": "Authenticator app enrolled"}
+
 # Token Management
 @app.post("/auth/refresh")
 async def refresh_token(refresh_token: str):
@@ -170,17 +430,121 @@ async def refresh_token(refresh_token: str):
         detail="Please re-authenticate to refresh token"
     )
 
+@app.post("/auth/session/token", response_model=TokenResponse)
+async def session_token(request: Request):
+    """Silently issue tokens for a user already signed in via the SSO session cookie"""
+    session = sessions.get(request.cookies.get(settings.SESSION_COOKIE_NAME))
+    if session is None:
+        raise HTTPException(status_code=401, detail="No active session")
+    
+    if session.two_factor:
+        access_token = jwt_manager.create_2fa_token(session.user_info, scopes=session.scopes)
+    else:
+        access_token = jwt_manager.create_access_token(session.user_info, scopes=session.scopes, requires_2fa=True)
+    event_log.emit(
+        "token_issued", sub=session.user_info.email, scopes=session.scopes,
+        two_factor=session.two_factor, via="session"
+    )
+    
+    return TokenResponse(
+        access_token=access_token,
+        refresh_token=jwt_manager.create_refresh_token(session.user_info.email),
+        expires_in=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        requires_2fa=not session.two_factor
+    )
+
+TOKEN_EXCHANGE_GRANT = "urn:ietf:params:oauth:grant-type:token-exchange"
+ACCESS_TOKEN_TYPE = "urn:ietf:params:oauth:token-type:access_token"
+
+@app.post("/auth/token/exchange", response_model=TokenExchangeResponse)
+async def exchange_token(
+    grant_type: str = Form(...),
+    subject_token: str = Form(...),
+    subject_token_type: str = Form(...),
+    audience: str = Form(...),
+    scope: str = Form(None)
+):
+    """Exchange a user token for a short-lived, audience-restricted, downscoped token (RFC 8693)"""
+    try:
+        if grant_type != TOKEN_EXCHANGE_GRANT:
+            raise TokenExchangeError("unsupported_grant_type", "Only token exchange is supported")
+        if subject_token_type != ACCESS_TOKEN_TYPE:
+            raise TokenExchangeError("invalid_request", "subject_token must be an access token")
+        if audience not in settings.TOKEN_EXCHANGE_AUDIENCES:
+            raise TokenExchangeError("invalid_target", f"Unknown audience: {audience}")
+        
+        token, exp, granted = jwt_manager.exchange_token(
+            subject_token, audience, scope.split() if scope else None
+        )
+    except TokenExchangeError as e:
+        return JSONResponse(status_code=400, content={"error": e.error, "error_description": e.description})
+    
+    return TokenExchangeResponse(
+        access_token=token,
+        expires_in=max(0, exp - int(time.time())),
+        scope=" ".join(granted)
+    )
+
 @app.post("/auth/verify", response_model=TokenValidation)
-async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """Verify token validity (for other services)"""
-    return jwt_manager.verify_token(credentials.credentials)
+async def verify_token(
+    audience: str = "comma-apps",
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Verify token validity (for other services; pass `audience` for exchanged tokens)"""
+    token_validation = jwt_manager.verify_token(credentials.credentials, audience=audience)
+    event_log.emit(
+        "verify",
+        sub=token_validation.user_info.email if token_validation.valid else None,
+        ok=token_validation.valid
+    )
+    return token_validation
 
 @app.post("/auth/logout")
-async def logout(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """Logout user (invalidate token)"""
-    # In production, you'd maintain a token blacklist
+async def logout(
+    request: Request,
+    response: Response,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
+):
+    """Logout user (invalidate token and end the SSO session)"""
+    # In production, you'd maintain a token blacklist.
+    # The bearer token is optional: the session cookie alone is enough to end the session
+    token_validation = jwt_manager.verify_token(credentials.credentials) if credentials else None
+    event_log.emit("logout", sub=token_validation.user_info.email if token_validation and token_validation.valid else None)
+    sessions.delete(request.cookies.get(settings.SESSION_COOKIE_NAME))
+    response.delete_cookie(
+        settings.SESSION_COOKIE_NAME,
+        domain=settings.SESSION_COOKIE_DOMAIN or None,
+        secure=settings.SESSION_COOKIE_SECURE,
+        httponly=True,
+        samesite="lax"
+    )
     return {"message": "Logged out successfully"}
 
+# Diagnostics (admin scope, after 2FA)
+@app.get("/debug/slow-requests")
+async def slow_request_log(admin: TokenValidation = Depends(require_admin)):
+    """Recent requests over SLOW_REQUEST_THRESHOLD_MS with their spans, and recent event-loop stalls"""
+    return {
+        "slow_requests": sorted(slow_requests, key=lambda r: r["at"], reverse=True),
+        "loop_stalls": list(loop_lag.stalls)[::-1],
+        "event_loop": loop_lag.snapshot()
+    }
+
+@app.get("/debug/profile", response_class=PlainTextResponse)
+async def profile(seconds: float = 10, interval_ms: float = 5, admin: TokenValidation = Depends(require_admin)):
+    """Sample the event-loop thread for `seconds`; returns collapsed stacks for flamegraph.pl / speedscope"""
+    if not 0 < seconds <= settings.PROFILE_MAX_SECONDS or interval_ms < 1:
+        raise HTTPException(
+            status_code=400,
+            detail=f"seconds must be in (0, {settings.PROFILE_MAX_SECONDS}] and interval_ms >= 1"
+        )
+    event_log.emit("profile", sub=admin.user_info.email, seconds=seconds)
+    # Sample from a worker thread so the loop keeps serving (and shows up in the profile)
+    stacks = await asyncio.to_thread(profiler.profile, threading.get_ident(), seconds, interval_ms / 1000)
+    if stacks is None:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    return stacks
+
 # Future endpoints for Apple ID and Microsoft
 @app.get("/auth/apple")
 async def apple_login(redirect_url: str = None):
@@ -20,7 +20,15 @@ class OTPRequest(BaseModel):
     phone_number: str
     
 class OTPVerification(BaseModel):
-    phone_number: str
+    phone_number: Optional[str] = None  # required for "sms"
+    code: str
+    method: str = "sms"  # "sms" (Twilio Verify) or "totp"
+
+class TOTPEnrollment(BaseModel):
+    secret: str
+    otpauth_uri: str
+
+class TOTPConfirmation(BaseModel):
     code: str
 
 class TokenValidation(BaseModel):
@@ -28,8 +36,24 @@ class TokenValidation(BaseModel):
     user_info: Optional[UserInfo] = None
     scopes: List[str] = []
     expires_at: Optional[datetime] = None
+    requires_2fa: bool = False
+
+class TokenExchangeResponse(BaseModel):
+    """RFC 8693 token exchange response"""
+    access_token: str
+    issued_token_type: str = "urn:ietf:params:oauth:token-type:access_token"
+    token_type: str = "bearer"
+    expires_in: int
+    scope: str
 
 class AuthState(BaseModel):
     provider: str
     redirect_url: Optional[str] = None
-    scopes: List[str] = []
\ No newline at end of file
+    scopes: List[str] = []
+
+class SSOSession(BaseModel):
+    user_info: UserInfo
+    scopes: List[str] = []
+    two_factor: bool = False
+    created_at: datetime
+    expires_at: datetime
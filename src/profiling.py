@@ -0,0 +1,196 @@
+"""
+Request span timing, sampling profiler and event-loop lag monitor
+
+`span("name")` times a phase of the current request (a no-op outside one).
+TimingMiddleware collects the spans, returns them in a `Server-Timing`
+header and appends requests over a latency threshold to a bounded buffer.
+
+SamplingProfiler snapshots the event-loop thread's stack from a separate
+thread at a fixed interval and returns collapsed stacks
+("frame;frame;frame count" lines, the input format of flamegraph.pl and
+speedscope).
+
+LoopLagMonitor runs a heartbeat task on the loop; a watchdog thread
+captures the loop thread's stack whenever a heartbeat is overdue, so each
+recorded stall names the blocking call that caused it.
+"""
+
+import asyncio
+import contextvars
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+Span = Tuple[str, float]
+
+_spans: contextvars.ContextVar[Optional[List[Span]]] = contextvars.ContextVar("spans", default=None)
+
+
+@contextmanager
+def span(name: str):
+    """Record how long the block takes as a span of the current request"""
+    spans = _spans.get()
+    if spans is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        spans.append((name, (time.perf_counter() - started) * 1000))
+
+
+def _collapse(frame, limit: int = 128) -> str:
+    names = []
+    while frame is not None and len(names) < limit:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class TimingMiddleware:
+    """ASGI middleware adding Server-Timing and recording requests slower than `slow_threshold_ms()`"""
+
+    def __init__(self, app, slow_requests: Deque[Dict], slow_threshold_ms: Callable[[], float], enabled: Callable[[], bool] = lambda: True):
+        self.app = app
+        self.slow_requests = slow_requests  # bounded deque owned by the caller
+        self.slow_threshold_ms = slow_threshold_ms
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        spans: List[Span] = []
+        token = _spans.set(spans)
+        started = time.perf_counter()
+        status = 0
+        include_header = self.enabled()
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if include_header:
+                    total = (time.perf_counter() - started) * 1000
+                    timing = ", ".join(f"{name};dur={ms:.1f}" for name, ms in spans + [("total", total)])
+                    message = dict(message, headers=list(message.get("headers", [])) + [(b"server-timing", timing.encode())])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _spans.reset(token)
+            total = (time.perf_counter() - started) * 1000
+            if total >= self.slow_threshold_ms():
+                self.slow_requests.append({
+                    "at": time.time(),
+                    "method": scope["method"],
+                    "path": scope["path"],  # no query string: it can carry codes and tokens
+                    "status": status,
+                    "total_ms": round(total, 3),
+                    "spans": [{"name": name, "ms": round(ms, 3)} for name, ms in spans],
+                })
+
+
+class SamplingProfiler:
+    """One-at-a-time sampler of a single thread's stack"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def profile(self, thread_id: int, seconds: float, interval: float = 0.005) -> Optional[str]:
+        """Blocking; sample `thread_id` for `seconds` and return collapsed stacks (None if busy)"""
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            stacks: Counter = Counter()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                frame = sys._current_frames().get(thread_id)
+                if frame is not None:
+                    stacks[_collapse(frame)] += 1
+                del frame
+                time.sleep(interval)
+            return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+        finally:
+            self._lock.release()
+
+
+class LoopLagMonitor:
+    def __init__(self, threshold_ms: float = 100.0, interval: float = 0.05, buffer_size: int = 100):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval
+        self.stalls: Deque[Dict] = deque(maxlen=buffer_size)
+        self.max_lag_ms = 0.0
+        self.loop_thread_id: Optional[int] = None
+        self._last_beat = 0.0
+        self._stack: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    async def start(self):
+        if self._task is not None:
+            return
+        self.loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stopped.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._watchdog.join()
+        self._watchdog = None
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._last_beat = now
+            lag = now - expected
+            self.max_lag_ms = max(self.max_lag_ms, lag * 1000)
+            if lag >= self.threshold:
+                self.stalls.append({
+                    "at": time.time() - lag,
+                    "lag_ms": round(lag * 1000, 3),
+                    "stack": self._stack,  # captured by the watchdog while the loop was blocked
+                })
+            self._stack = None
+
+    def _watch(self):
+        # Check often enough to catch the blocking frame while it is still on the stack
+        while not self._stopped.wait(self.threshold / 2):
+            overdue = time.monotonic() - self._last_beat - self.interval
+            if overdue >= self.threshold and self._stack is None:
+                frame = sys._current_frames().get(self.loop_thread_id)
+                if frame is not None:
+                    self._stack = _collapse(frame)
+                del frame
+
+    def snapshot(self) -> Dict:
+        return {
+            "threshold_ms": self.threshold * 1000,
+            "max_lag_ms": round(self.max_lag_ms, 3),
+            "stalls": len(self.stalls),
+        }
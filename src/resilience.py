@@ -0,0 +1,259 @@
+"""
+Resilience primitives for upstream calls (Google, Microsoft, Twilio)
+
+Each provider gets an Upstream wrapping a concurrency bulkhead, a circuit
+breaker that trips on failures *and* slow calls, and a per-call timeout that
+is clamped to the request deadline set via `deadline()`.
+"""
+
+import asyncio
+import contextvars
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("upstream_deadline", default=None)
+
+
+class UpstreamUnavailable(Exception):
+    """Raised when an upstream call is rejected or fails fast"""
+
+    def __init__(self, upstream: str, reason: str):
+        self.upstream = upstream
+        self.reason = reason
+        super().__init__(f"{upstream} unavailable: {reason}")
+
+
+@contextmanager
+def deadline(seconds: float):
+    """Bound every upstream call in this context to finish within `seconds`"""
+    new_deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        new_deadline = min(new_deadline, current)
+    token = _deadline.set(new_deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time(default: float) -> float:
+    """Seconds left before the current deadline, capped at `default`"""
+    current = _deadline.get()
+    if current is None:
+        return default
+    return min(default, current - time.monotonic())
+
+
+class CircuitBreaker:
+    """Rolling-window breaker counting failures and calls slower than `slow_call_seconds`"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        window_size: int = 20,
+        failure_ratio: float = 0.5,
+        slow_call_seconds: float = 2.0,
+        min_calls: int = 5,
+        reset_timeout: float = 30.0,
+    ):
+        self.window: Deque[bool] = deque(maxlen=window_size)
+        self.failure_ratio = failure_ratio
+        self.slow_call_seconds = slow_call_seconds
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        """Return True if a call may proceed"""
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def record(self, success: bool, elapsed: float):
+        """Record the outcome of a call permitted by allow()"""
+        bad = not success or elapsed >= self.slow_call_seconds
+        if self.state == self.HALF_OPEN:
+            self._probe_in_flight = False
+            if bad:
+                self._trip()
+            else:
+                self.state = self.CLOSED
+                self.window.clear()
+            return
+
+        self.window.append(bad)
+        if len(self.window) >= self.min_calls and sum(self.window) / len(self.window) >= self.failure_ratio:
+            self._trip()
+
+    def release(self):
+        """Give back a permit from allow() without judging the upstream"""
+        self._probe_in_flight = False
+
+    def _trip(self):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.window.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "recent_calls": len(self.window),
+            "recent_bad_calls": sum(self.window),
+        }
+
+
+class Upstream:
+    """Bulkhead + circuit breaker + deadline-aware timeout for one provider"""
+
+    def __init__(
+        self,
+        name: str,
+        timeout: float,
+        max_concurrency: int,
+        acquire_timeout: float = 0.5,
+        breaker: Optional[CircuitBreaker] = None,
+        is_failure: Optional[Callable[[BaseException], bool]] = None,
+    ):
+        self.name = name
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.acquire_timeout = acquire_timeout
+        self.breaker = breaker or CircuitBreaker(slow_call_seconds=timeout * 0.8)
+        # Lets providers keep caller errors (bad OTP code, 4xx) from tripping the breaker
+        self.is_failure = is_failure or (lambda exc: True)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # Blocking SDK calls get their own threads so one provider's brownout can't
+        # exhaust the loop's default executor for everyone else
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=f"upstream-{name}")
+        self.in_flight = 0
+        self.rejected = 0
+
+    def call_timeout(self) -> float:
+        """Timeout for the next call, clamped to the propagated deadline"""
+        timeout = remaining_time(self.timeout)
+        if timeout <= 0:
+            raise UpstreamUnavailable(self.name, "deadline exceeded")
+        return timeout
+
+    async def call(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run `fn()` under the bulkhead, breaker and deadline"""
+        return await self._call(fn, threads=None)
+
+    async def _call(self, fn: Callable[[], Awaitable[Any]], threads: Optional[List[Future]]) -> Any:
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise UpstreamUnavailable(self.name, "circuit open")
+
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), min(self.acquire_timeout, self.call_timeout()))
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            self.breaker.release()
+            raise UpstreamUnavailable(self.name, "bulkhead full")
+        except UpstreamUnavailable:
+            self.breaker.release()
+            raise
+
+        # Checked before fn() is created: running out of our own deadline while
+        # queued is not the upstream's fault and must not leave a coroutine unawaited
+        try:
+            timeout = self.call_timeout()
+        except UpstreamUnavailable:
+            self._semaphore.release()
+            self.breaker.release()
+            raise
+
+        self.in_flight += 1
+        success = False
+        cancelled = False
+        try:
+            result = await asyncio.wait_for(fn(), timeout)
+            success = True
+            return result
+        except asyncio.TimeoutError:
+            raise UpstreamUnavailable(self.name, "timed out")
+        except Exception as exc:
+            success = not self.is_failure(exc)
+            raise
+        except asyncio.CancelledError:
+            # e.g. the losing half of a hedged pair; says nothing about the upstream
+            cancelled = True
+            raise
+        finally:
+            self.in_flight -= 1
+            if threads and not threads[0].done():
+                # A timed-out thread keeps running; it holds its bulkhead slot until it returns
+                loop = asyncio.get_running_loop()
+                threads[0].add_done_callback(lambda _: self._release_from_thread(loop))
+            else:
+                self._semaphore.release()
+            if cancelled:
+                self.breaker.release()
+            else:
+                self.breaker.record(success, time.monotonic() - started)
+
+    def run_sync(self, fn: Callable[..., Any], *args, **kwargs) -> Awaitable[Any]:
+        """Run a blocking SDK call on this upstream's threads under its protections"""
+        threads: List[Future] = []
+
+        def submit() -> Awaitable[Any]:
+            threads.append(self._executor.submit(partial(fn, *args, **kwargs)))
+            return asyncio.wrap_future(threads[0])
+
+        return self._call(submit, threads)
+
+    def _release_from_thread(self, loop: asyncio.AbstractEventLoop):
+        try:
+            loop.call_soon_threadsafe(self._semaphore.release)
+        except RuntimeError:
+            pass  # loop already closed
+
+    async def hedged(self, fn: Callable[[], Awaitable[Any]], hedge_after: float) -> Any:
+        """
+        Call `fn()` and, if it has not finished after `hedge_after` seconds,
+        race a second attempt against it. Only use for idempotent reads.
+        """
+        first = asyncio.ensure_future(self.call(fn))
+        done, _ = await asyncio.wait({first}, timeout=hedge_after)
+        if done:
+            return first.result()
+
+        second = asyncio.ensure_future(self.call(fn))
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.breaker.snapshot(),
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,166 @@
+"""
+Server-side SSO sessions
+
+The browser only holds an opaque session id in a cookie scoped to the parent
+domain; the signed-in user, scopes and 2FA state live here. Properties call
+/auth/session/token to get fresh tokens without another Google/Twilio round trip.
+
+With `uvicorn --workers N` use the SQLite store (the default): every worker on
+the host sees the same sessions. The in-memory store is per process, so it
+only works with a single worker.
+"""
+
+import json
+import os
+import secrets
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from .models import SSOSession, UserInfo
+
+
+class SessionStore:
+    """In-memory session store; per process, so single-worker only"""
+
+    def __init__(self, ttl_hours: int):
+        self.ttl = timedelta(hours=ttl_hours)
+        self._sessions: Dict[str, SSOSession] = {}
+        self._last_purge = 0.0
+
+    def create(self, user_info: UserInfo, scopes: List[str], two_factor: bool = False) -> str:
+        self._purge_expired()
+        now = datetime.utcnow()
+        session_id = secrets.token_urlsafe(32)
+        self._sessions[session_id] = SSOSession(
+            user_info=user_info,
+            scopes=scopes,
+            two_factor=two_factor,
+            created_at=now,
+            expires_at=now + self.ttl
+        )
+        return session_id
+
+    def get(self, session_id: Optional[str]) -> Optional[SSOSession]:
+        if not session_id:
+            return None
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        if session.expires_at < datetime.utcnow():
+            self._sessions.pop(session_id, None)
+            return None
+        return session
+
+    def elevate(self, session_id: Optional[str], email: str, scopes: List[str]) -> Optional[str]:
+        """Mark a session 2FA-complete; returns a new id (rotated on privilege change)"""
+        session = self.get(session_id)
+        if session is None or session.user_info.email != email:
+            return None
+        del self._sessions[session_id]
+        new_id = secrets.token_urlsafe(32)
+        self._sessions[new_id] = session.model_copy(update={"scopes": scopes, "two_factor": True})
+        return new_id
+
+    def delete(self, session_id: Optional[str]):
+        if session_id:
+            self._sessions.pop(session_id, None)
+
+    def _purge_expired(self):
+        # Amortized: lookups already drop expired sessions lazily
+        if time.monotonic() - self._last_purge < 60:
+            return
+        self._last_purge = time.monotonic()
+        now = datetime.utcnow()
+        for session_id in [sid for sid, s in self._sessions.items() if s.expires_at < now]:
+            del self._sessions[session_id]
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+class SQLiteSessionStore:
+    """Session store in a local SQLite file (WAL), shared by every worker on the host"""
+
+    def __init__(self, path: str, ttl_hours: int):
+        self.ttl = timedelta(hours=ttl_hours)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " id TEXT PRIMARY KEY,"
+            " email TEXT NOT NULL,"
+            " user_info TEXT NOT NULL,"
+            " scopes TEXT NOT NULL,"
+            " two_factor INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " expires_at REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+        self._last_purge = 0.0
+
+    def create(self, user_info: UserInfo, scopes: List[str], two_factor: bool = False) -> str:
+        self._purge_expired()
+        now = time.time()
+        session_id = secrets.token_urlsafe(32)
+        self.conn.execute(
+            "INSERT INTO sessions (id, email, user_info, scopes, two_factor, created_at, expires_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (session_id, user_info.email, user_info.model_dump_json(), json.dumps(scopes), int(two_factor),
+             now, now + self.ttl.total_seconds())
+        )
+        return session_id
+
+    def get(self, session_id: Optional[str]) -> Optional[SSOSession]:
+        if not session_id:
+            return None
+        row = self.conn.execute(
+            "SELECT user_info, scopes, two_factor, created_at, expires_at FROM sessions"
+            " WHERE id = ? AND expires_at > ?",
+            (session_id, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        return SSOSession(
+            user_info=UserInfo.model_validate_json(row[0]),
+            scopes=json.loads(row[1]),
+            two_factor=bool(row[2]),
+            created_at=datetime.utcfromtimestamp(row[3]),
+            expires_at=datetime.utcfromtimestamp(row[4])
+        )
+
+    def elevate(self, session_id: Optional[str], email: str, scopes: List[str]) -> Optional[str]:
+        """Mark a session 2FA-complete; returns a new id (rotated on privilege change)"""
+        if not session_id:
+            return None
+        new_id = secrets.token_urlsafe(32)
+        # One conditional UPDATE, so two workers can't both rotate the same session
+        updated = self.conn.execute(
+            "UPDATE sessions SET id = ?, scopes = ?, two_factor = 1"
+            " WHERE id = ? AND email = ? AND expires_at > ?",
+            (new_id, json.dumps(scopes), session_id, email, time.time())
+        )
+        return new_id if updated.rowcount == 1 else None
+
+    def delete(self, session_id: Optional[str]):
+        if session_id:
+            self.conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def _purge_expired(self):
+        if time.monotonic() - self._last_purge < 60:
+            return
+        self._last_purge = time.monotonic()
+        self.conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (time.time(),))
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM sessions WHERE expires_at > ?", (time.time(),)).fetchone()[0]
+
+
+def create_session_store(kind: str, path: str, ttl_hours: int):
+    """Build the configured store; 'memory' only works with a single worker"""
+    if kind == "sqlite":
+        return SQLiteSessionStore(path, ttl_hours=ttl_hours)
+    if kind == "memory":
+        return SessionStore(ttl_hours=ttl_hours)
+    raise ValueError(f"Unknown SESSION_STORE: {kind}")
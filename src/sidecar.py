@@ -0,0 +1,199 @@
+"""
+Unix-socket verification sidecar
+
+A binary alternative to `POST /auth/verify` for apps on the same host: no
+HTTP parsing, no JSON, no pydantic serialization. Every frame is
+length-prefixed (little-endian), and clients may pipeline any number of
+requests on a connection; responses come back in request order, tagged
+with the request id.
+
+    request:  length u32 | id u32 | audience_len u8 | audience | token
+    response: length u32 | id u32 | status u8 | flags u8 | exp u32 | fields
+
+`length` counts the bytes after itself. For STATUS_VALID, `fields` holds
+six u16-length-prefixed UTF-8 strings: email, name, picture, domain,
+provider and the space-separated scopes. Other statuses carry no fields.
+
+With `uvicorn --workers N` every worker starts a sidecar, but only the one
+holding an flock on `<path>.lock` binds the socket; the others retry, so a
+replacement takes over if that worker exits.
+"""
+
+import asyncio
+import fcntl
+import os
+import struct
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from .models import TokenValidation
+
+REQUEST_HEADER = struct.Struct("<IB")  # id, audience length
+RESPONSE_HEADER = struct.Struct("<IIBBI")  # length, id, status, flags, exp
+LENGTH = struct.Struct("<I")
+FIELD_LENGTH = struct.Struct("<H")
+MAX_FRAME = 16 * 1024
+
+STATUS_INVALID = 0
+STATUS_VALID = 1
+STATUS_BAD_REQUEST = 2
+FLAG_REQUIRES_2FA = 1
+
+
+def encode_response(request_id: int, validation: Optional[TokenValidation]) -> bytes:
+    if validation is None:
+        return RESPONSE_HEADER.pack(RESPONSE_HEADER.size - 4, request_id, STATUS_BAD_REQUEST, 0, 0)
+    if not validation.valid or validation.user_info is None:
+        return RESPONSE_HEADER.pack(RESPONSE_HEADER.size - 4, request_id, STATUS_INVALID, 0, 0)
+
+    user = validation.user_info
+    body = bytearray()
+    for value in (user.email, user.name, user.picture, user.domain, user.provider, " ".join(validation.scopes)):
+        data = (value or "").encode()[:0xFFFF]
+        body += FIELD_LENGTH.pack(len(data))
+        body += data
+    exp = int((validation.expires_at - datetime(1970, 1, 1)).total_seconds()) if validation.expires_at else 0
+    flags = FLAG_REQUIRES_2FA if validation.requires_2fa else 0
+    return RESPONSE_HEADER.pack(RESPONSE_HEADER.size - 4 + len(body), request_id, STATUS_VALID, flags, exp) + body
+
+
+class VerificationSidecar:
+    def __init__(
+        self,
+        path: str,
+        verify: Callable[[str, str], TokenValidation],
+        event_log=None,
+        permissions: int = 0o660,
+        claim_interval: float = 5.0
+    ):
+        self.path = path
+        self.verify = verify
+        self.event_log = event_log
+        self.permissions = permissions
+        self.claim_interval = claim_interval
+        self._lock_fd: Optional[int] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._claim_task: Optional[asyncio.Task] = None
+
+        self.connections = 0
+        self.requests = 0
+        self.batches = 0
+        self.protocol_errors = 0
+
+    @property
+    def serving(self) -> bool:
+        return self._server is not None
+
+    async def start(self):
+        if self._claim_task is None:
+            self._claim_task = asyncio.create_task(self._claim_loop())
+
+    async def stop(self):
+        if self._claim_task is not None:
+            self._claim_task.cancel()
+            try:
+                await self._claim_task
+            except asyncio.CancelledError:
+                pass
+            self._claim_task = None
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)  # releases the flock for the next worker
+            self._lock_fd = None
+
+    async def _claim_loop(self):
+        while self._server is None:
+            if self._try_lock():
+                # We own the path now; anything left there is from a dead worker
+                try:
+                    os.unlink(self.path)
+                except FileNotFoundError:
+                    pass
+                self._server = await asyncio.start_unix_server(self._serve, path=self.path, limit=MAX_FRAME * 4)
+                os.chmod(self.path, self.permissions)
+                return
+            await asyncio.sleep(self.claim_interval)
+
+    def _try_lock(self) -> bool:
+        fd = os.open(f"{self.path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        buffer = bytearray()
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                buffer += data
+                # Answer every complete frame that arrived together with one write
+                out = bytearray()
+                offset = 0
+                while len(buffer) - offset >= LENGTH.size:
+                    length = LENGTH.unpack_from(buffer, offset)[0]
+                    if length < REQUEST_HEADER.size or length > MAX_FRAME:
+                        self.protocol_errors += 1
+                        return
+                    end = offset + LENGTH.size + length
+                    if len(buffer) < end:
+                        break
+                    out += self._answer(buffer, offset + LENGTH.size, end)
+                    offset = end
+                del buffer[:offset]
+                if out:
+                    self.batches += 1
+                    writer.write(out)
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    def _answer(self, buffer: bytearray, start: int, end: int) -> bytes:
+        self.requests += 1
+        request_id, audience_length = REQUEST_HEADER.unpack_from(buffer, start)
+        token_start = start + REQUEST_HEADER.size + audience_length
+        if token_start >= end:
+            self.protocol_errors += 1
+            return encode_response(request_id, None)
+        try:
+            audience = buffer[start + REQUEST_HEADER.size:token_start].decode()
+            token = buffer[token_start:end].decode()
+        except UnicodeDecodeError:
+            self.protocol_errors += 1
+            return encode_response(request_id, None)
+
+        validation = self.verify(token, audience or "comma-apps")
+        if self.event_log is not None:
+            self.event_log.emit(
+                "verify",
+                sub=validation.user_info.email if validation.valid else None,
+                ok=validation.valid,
+                via="socket"
+            )
+        return encode_response(request_id, validation)
+
+    def snapshot(self) -> Dict:
+        return {
+            "path": self.path,
+            "serving": self.serving,
+            "connections": self.connections,
+            "requests": self.requests,
+            "avg_pipeline_depth": round(self.requests / self.batches, 2) if self.batches else 0.0,
+            "protocol_errors": self.protocol_errors,
+        }
@@ -0,0 +1,54 @@
+"""
+Shared fixtures
+
+src.config reads the environment at import, so everything the app would
+otherwise write under data/ or logs/ is pointed at a scratch directory here,
+before any test module imports src.
+"""
+
+import os
+import socket
+import tempfile
+import threading
+import time
+
+import pytest
+from cryptography.fernet import Fernet
+
+_scratch = tempfile.mkdtemp(prefix="comma-auth-tests-")
+os.environ.update({
+    "JWT_SECRET_KEY": "test-secret",
+    "TOTP_ENCRYPTION_KEY": Fernet.generate_key().decode(),
+    "TOTP_STORE_PATH": f"{_scratch}/totp.db",
+    "SESSION_STORE_PATH": f"{_scratch}/sessions.db",
+    "AUDIT_LOG_SINK": "none",
+    "AUDIT_LOG_PATH": f"{_scratch}/audit.jsonl",
+    # benchmarks.fake_directory reads these at import
+    "FAKE_DIRECTORY_USERS": "40",
+    "FAKE_DIRECTORY_LATENCY_MS": "0",
+})
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="session")
+def fake_directory_url():
+    """Base URL of benchmarks.fake_directory served on a local port for the whole session"""
+    import uvicorn
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config("benchmarks.fake_directory:app", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError("fake directory did not start")
+        time.sleep(0.05)
+    yield f"http://127.0.0.1:{port}/admin/directory/v1"
+    server.should_exit = True
+    thread.join()
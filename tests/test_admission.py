@@ -0,0 +1,86 @@
+import asyncio
+
+import httpx
+import pytest
+
+from src.admission import AdmissionControlMiddleware, AdmissionPool
+
+
+def test_pool_sheds_when_queue_is_full_and_on_queue_timeout():
+    pool = AdmissionPool("login", max_concurrency=1, max_queue=1, queue_timeout=0.05)
+
+    async def run():
+        assert await pool.acquire()
+        queued = asyncio.create_task(pool.acquire())
+        await asyncio.sleep(0)
+        assert not await pool.acquire()  # queue full: shed at once
+        assert not await queued  # waited past the queue deadline
+        pool.release()
+        assert await pool.acquire()
+        pool.release()
+
+    asyncio.run(run())
+    snapshot = pool.snapshot()
+    assert snapshot["shed_queue_full"] == 1
+    assert snapshot["shed_queue_timeout"] == 1
+    assert snapshot["admitted"] == 2
+    assert snapshot["active"] == 0
+
+
+def _app(release: asyncio.Event):
+    async def app(scope, receive, send):
+        if scope["path"].startswith("/auth/google"):
+            await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+    return app
+
+
+def test_login_flood_is_shed_without_starving_verify():
+    async def run():
+        release = asyncio.Event()
+        pools = {
+            "verify": AdmissionPool("verify", max_concurrency=1, max_queue=1, queue_timeout=1.0),
+            "login": AdmissionPool("login", max_concurrency=1, max_queue=0, queue_timeout=1.0),
+        }
+        app = AdmissionControlMiddleware(
+            _app(release), pools=pools,
+            routes=[("/auth/verify", "verify"), ("/auth/google", "login")], retry_after=3
+        )
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            blocked = asyncio.create_task(client.get("/auth/google"))
+            await asyncio.sleep(0.05)
+
+            shed = await client.get("/auth/google/callback")
+            assert shed.status_code == 503
+            assert shed.headers["retry-after"] == "3"
+            assert "login" in shed.json()["detail"]
+
+            assert (await client.post("/auth/verify")).status_code == 200
+            assert (await client.get("/health")).status_code == 200  # unclassified routes bypass admission
+
+            release.set()
+            assert (await blocked).status_code == 200
+        return pools
+
+    pools = asyncio.run(run())
+    assert pools["login"].snapshot()["shed_queue_full"] == 1
+    assert pools["verify"].snapshot()["admitted"] == 1
+    assert pools["login"].active == pools["verify"].active == 0
+
+
+@pytest.mark.parametrize("path, pool", [
+    ("/auth/verify", "verify"),
+    ("/auth/token/exchange", "verify"),
+    ("/auth/google/callback", "login"),
+    ("/auth/otp/verify", "login"),
+    ("/auth/totp/confirm", "login"),
+    ("/auth/session/token", "login"),
+    ("/health", None),
+])
+def test_app_routes_map_to_pools(path, pool):
+    from src.main import admission_pools, app
+
+    middleware = next(m for m in app.user_middleware if m.cls is AdmissionControlMiddleware)
+    admission = AdmissionControlMiddleware(None, **middleware.kwargs)
+    assert admission.pool_for(path) is (admission_pools[pool] if pool else None)
@@ -0,0 +1,90 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from src.auth import google_directory
+from src.auth.google_directory import GoogleDirectory
+from src.config import settings
+
+# benchmarks.fake_directory with 40 users: user{i} is in admins@ when i % 10 == 0,
+# in staff@ when i % 3 == 0, and under /Staff/Engineering when i % 4 == 0
+RULES = {
+    "group:admins@comma.cm": ["read", "write", "admin"],
+    "orgunit:/Staff": ["read", "write"],
+    "group:Staff@Comma.cm": ["deploy"],  # group keys are case-insensitive
+    "orgunit:/Staf": ["never"],  # org units match whole path segments only
+}
+EXPECTED = {
+    "user0@comma.cm": ["read", "write", "admin", "deploy"],
+    "user4@comma.cm": ["read", "write"],
+    "user3@comma.cm": ["deploy"],
+    "User3@Comma.cm": ["deploy"],
+    "user1@comma.cm": ["read"],  # in the directory, matches no rule: default scopes
+    "ghost@comma.cm": ["read"],  # not in the directory: default scopes
+}
+
+
+@pytest.fixture
+def directory_settings(monkeypatch, fake_directory_url):
+    monkeypatch.setattr(settings, "GOOGLE_DIRECTORY_URL", fake_directory_url)
+    monkeypatch.setattr(settings, "GOOGLE_DIRECTORY_CREDENTIALS_FILE", "")
+    monkeypatch.setattr(settings, "DIRECTORY_SCOPE_RULES", RULES)
+    monkeypatch.setattr(settings, "DIRECTORY_DEFAULT_SCOPES", ["read"])
+
+
+async def _scopes(indexed: bool):
+    directory = GoogleDirectory()
+    if indexed:
+        await directory.refresh_index()
+    scopes = {email: await directory.scopes_for(email, fallback=["fallback"]) for email in EXPECTED}
+    return scopes, directory
+
+
+def test_rules_map_per_user_lookups_to_scopes(directory_settings):
+    scopes, directory = asyncio.run(_scopes(indexed=False))
+    assert scopes == EXPECTED
+    assert directory.fetch_errors == 0
+    assert directory.index_hits == 0
+
+
+def test_rules_map_the_background_index_to_scopes(directory_settings):
+    scopes, directory = asyncio.run(_scopes(indexed=True))
+    assert scopes == EXPECTED
+    assert directory.fetch_errors == 0
+    assert directory.index_hits == len(EXPECTED)
+
+
+def test_negative_results_are_cached(directory_settings):
+    async def run():
+        directory = GoogleDirectory()
+        for _ in range(3):
+            assert await directory.scopes_for("ghost@comma.cm", fallback=[]) == ["read"]
+        return directory
+
+    directory = asyncio.run(run())
+    assert directory.misses == 1
+    assert directory.negative_hits == 2
+
+
+def test_no_rules_returns_the_fallback(monkeypatch):
+    monkeypatch.setattr(settings, "DIRECTORY_SCOPE_RULES", {})
+    directory = GoogleDirectory()
+    assert asyncio.run(directory.scopes_for("user0@comma.cm", fallback=["fallback"])) == ["fallback"]
+
+
+def test_no_index_is_not_served_early_after_boot(directory_settings, monkeypatch):
+    # time.monotonic() counts from boot, so it can be below the TTL on a fresh host
+    clock = SimpleNamespace(monotonic=lambda: 5.0, perf_counter=time.perf_counter)
+    monkeypatch.setattr(google_directory, "time", clock)
+
+    async def run():
+        directory = GoogleDirectory()
+        scopes = await directory.scopes_for("user0@comma.cm", fallback=[])
+        return scopes, directory
+
+    scopes, directory = asyncio.run(run())
+    assert scopes == EXPECTED["user0@comma.cm"]
+    assert directory.index_hits == 0
+    assert directory.snapshot()["index_age_seconds"] is None
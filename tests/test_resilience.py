@@ -0,0 +1,133 @@
+import asyncio
+import threading
+
+import pytest
+import requests
+from google_auth_oauthlib.flow import Flow
+from oauthlib.oauth2.rfc6749.errors import InvalidGrantError, ServerError
+
+from src.auth.google import GoogleAuthProvider, _raise_for_server_error
+from src.resilience import CircuitBreaker, Upstream, UpstreamUnavailable
+
+
+def _calls(upstream: Upstream, exc: BaseException, count: int):
+    async def fail():
+        raise exc
+
+    async def run():
+        for _ in range(count):
+            with pytest.raises(type(exc)):
+                await upstream.call(fail)
+
+    asyncio.run(run())
+
+
+def test_breaker_opens_on_failures_and_rejects_calls():
+    upstream = Upstream("test", timeout=1.0, max_concurrency=5, breaker=CircuitBreaker(min_calls=5))
+    _calls(upstream, RuntimeError("down"), 5)
+    assert upstream.breaker.state == CircuitBreaker.OPEN
+
+    async def ok():
+        return "ok"
+
+    with pytest.raises(UpstreamUnavailable, match="circuit open"):
+        asyncio.run(upstream.call(ok))
+    assert upstream.rejected == 1
+
+
+def test_breaker_half_open_probe_closes_on_success():
+    upstream = Upstream("test", timeout=1.0, max_concurrency=5, breaker=CircuitBreaker(min_calls=5, reset_timeout=0))
+    _calls(upstream, RuntimeError("down"), 5)
+
+    async def ok():
+        return "ok"
+
+    assert asyncio.run(upstream.call(ok)) == "ok"
+    assert upstream.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_caller_errors_do_not_count_against_the_breaker():
+    upstream = Upstream("test", timeout=1.0, max_concurrency=5, is_failure=lambda exc: not isinstance(exc, ValueError))
+    _calls(upstream, ValueError("bad input"), 20)
+    assert upstream.breaker.state == CircuitBreaker.CLOSED
+    assert upstream.breaker.snapshot()["recent_bad_calls"] == 0
+
+
+def test_bulkhead_rejects_when_full():
+    upstream = Upstream("test", timeout=1.0, max_concurrency=1, acquire_timeout=0.05)
+
+    async def run():
+        release = asyncio.Event()
+
+        async def hold():
+            await release.wait()
+
+        holder = asyncio.create_task(upstream.call(hold))
+        await asyncio.sleep(0)
+        with pytest.raises(UpstreamUnavailable, match="bulkhead full"):
+            await upstream.call(hold)
+        release.set()
+        await holder
+
+    asyncio.run(run())
+    assert upstream.rejected == 1
+    assert upstream.breaker.state == CircuitBreaker.CLOSED
+
+
+@pytest.mark.parametrize("exc, is_failure", [
+    (InvalidGrantError(), False),
+    (ServerError(), True),
+    (requests.ConnectionError(), True),
+    (requests.HTTPError("502 Bad Gateway"), True),
+])
+def test_google_failure_classifier(exc, is_failure):
+    assert GoogleAuthProvider._is_upstream_failure(exc) is is_failure
+
+
+def test_bad_google_codes_do_not_open_the_breaker(monkeypatch):
+    def fetch_token(self, **kwargs):
+        raise InvalidGrantError()
+
+    monkeypatch.setattr(Flow, "fetch_token", fetch_token)
+    google = GoogleAuthProvider()
+
+    async def run():
+        for _ in range(10):
+            with pytest.raises(InvalidGrantError):
+                await google.exchange_code_for_token("garbage", "state")
+
+    asyncio.run(run())
+    assert google.upstream.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_google_token_5xx_is_raised_before_oauthlib_parses_it():
+    response = requests.Response()
+    response.status_code = 503
+    with pytest.raises(requests.HTTPError):
+        _raise_for_server_error(response)
+
+    response.status_code = 400
+    assert _raise_for_server_error(response) is response
+
+
+def test_run_sync_uses_the_upstreams_own_threads():
+    upstream = Upstream("twilio", timeout=1.0, max_concurrency=2)
+    name = asyncio.run(upstream.run_sync(lambda: threading.current_thread().name))
+    assert name.startswith("upstream-twilio")
+
+
+def test_timed_out_thread_keeps_its_bulkhead_slot_until_it_returns():
+    upstream = Upstream("test", timeout=0.05, max_concurrency=1, acquire_timeout=0.05)
+    release = threading.Event()
+
+    async def run():
+        with pytest.raises(UpstreamUnavailable, match="timed out"):
+            await upstream.run_sync(release.wait, 5)
+        # The thread is still blocked, so the single slot is still taken
+        with pytest.raises(UpstreamUnavailable, match="bulkhead full"):
+            await upstream.run_sync(lambda: "ok")
+        release.set()
+        await asyncio.sleep(0.05)
+        return await upstream.run_sync(lambda: "ok")
+
+    assert asyncio.run(run()) == "ok"
@@ -0,0 +1,81 @@
+import os
+import struct
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from src.auth.jwt_manager import JWTManager
+from src.auth.shared_cache import SLOT_SIZE, SharedVerificationCache
+from src.models import UserInfo
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+USER = UserInfo(email="a@comma.cm", name="A", domain="comma.cm", provider="google")
+
+
+@pytest.fixture
+def verified():
+    jwt_manager = JWTManager()
+    token = jwt_manager.create_access_token(USER, scopes=["read", "write"])
+    return token, jwt_manager.verify_token(token)
+
+
+def test_record_round_trips_between_workers(tmp_path, verified):
+    token, validation = verified
+    path = str(tmp_path / "verify.cache")
+    writer = SharedVerificationCache(path, secret="k", slots=64)
+    reader = SharedVerificationCache(path, secret="k", slots=64)
+
+    assert reader.get(token, "comma-apps") is None
+    writer.put(token, "comma-apps", validation)
+    cached = reader.get(token, "comma-apps")
+    assert cached.valid
+    assert cached.user_info.email == USER.email
+    assert cached.scopes == ["read", "write"]
+    assert cached.requires_2fa == validation.requires_2fa
+    assert reader.get(token, "other-app") is None
+
+
+def test_rekey_makes_old_records_miss(tmp_path, verified):
+    token, validation = verified
+    cache = SharedVerificationCache(str(tmp_path / "verify.cache"), secret="k", slots=64)
+    cache.put(token, "comma-apps", validation)
+    cache.rekey("rotated")
+    assert cache.get(token, "comma-apps") is None
+
+
+def test_slot_mid_write_reads_as_a_miss(tmp_path, verified):
+    token, validation = verified
+    cache = SharedVerificationCache(str(tmp_path / "verify.cache"), secret="k", slots=64)
+    cache.put(token, "comma-apps", validation)
+    for offset in range(64, 64 + 64 * SLOT_SIZE, SLOT_SIZE):
+        seq = struct.unpack_from("<I", cache.map, offset)[0]
+        if seq:
+            struct.pack_into("<I", cache.map, offset, seq + 1)  # odd: a writer is in the slot
+    assert cache.get(token, "comma-apps") is None
+
+    # The next writer recovers the slot from a writer that died mid-update
+    cache.put(token, "comma-apps", validation)
+    assert cache.get(token, "comma-apps") is not None
+
+
+def test_layout_change_never_resizes_a_mapped_file(tmp_path, verified):
+    token, validation = verified
+    path = str(tmp_path / "verify.cache")
+    old_worker = SharedVerificationCache(path, secret="k", slots=1024)
+    old_worker.put(token, "comma-apps", validation)
+
+    # A worker restarted with a different SHARED_VERIFY_CACHE_SLOTS, in another process
+    script = textwrap.dedent(f"""
+        from src.auth.shared_cache import SharedVerificationCache
+        SharedVerificationCache({path!r}, secret="k", slots=64)
+    """)
+    subprocess.run([sys.executable, "-c", script], check=True, cwd=ROOT)
+
+    # Used to SIGBUS here: the old worker keeps its own (now unlinked) table
+    assert old_worker.get(token, "comma-apps") is not None
+    new_worker = SharedVerificationCache(path, secret="k", slots=64)
+    assert new_worker.slots == 64
+    assert new_worker.get(token, "comma-apps") is None
+    assert os.path.getsize(path) == 64 + 64 * SLOT_SIZE
@@ -0,0 +1,40 @@
+import pytest
+
+from src.auth.jwt_manager import JWTManager, TokenExchangeError
+from src.models import UserInfo
+
+USER = UserInfo(email="a@comma.cm", name="A", domain="comma.cm", provider="google")
+
+
+@pytest.fixture
+def jwt_manager():
+    return JWTManager()
+
+
+def test_scopes_beyond_the_subject_token_raise_invalid_scope(jwt_manager):
+    subject = jwt_manager.create_access_token(USER, scopes=["read"])
+    with pytest.raises(TokenExchangeError) as excinfo:
+        jwt_manager.exchange_token(subject, "comma-api", ["read", "write"])
+    assert excinfo.value.error == "invalid_scope"
+
+
+def test_invalid_scope_is_not_served_from_a_cached_exchange(jwt_manager):
+    subject = jwt_manager.create_access_token(USER, scopes=["read"])
+    jwt_manager.exchange_token(subject, "comma-api", ["read"])
+    with pytest.raises(TokenExchangeError) as excinfo:
+        jwt_manager.exchange_token(subject, "comma-api", ["read", "write"])
+    assert excinfo.value.error == "invalid_scope"
+
+
+def test_downscoped_exchange_is_audience_restricted(jwt_manager):
+    subject = jwt_manager.create_access_token(USER, scopes=["read", "write"])
+    token, _, granted = jwt_manager.exchange_token(subject, "comma-api", ["read"])
+    assert granted == ["read"]
+    assert jwt_manager.verify_token(token, audience="comma-api").scopes == ["read"]
+    assert not jwt_manager.verify_token(token, audience="comma-apps").valid
+
+
+def test_invalid_subject_token_raises_invalid_grant(jwt_manager):
+    with pytest.raises(TokenExchangeError) as excinfo:
+        jwt_manager.exchange_token("not-a-token", "comma-api", ["read"])
+    assert excinfo.value.error == "invalid_grant"
@@ -0,0 +1,139 @@
+import base64
+import time
+
+import pytest
+
+from src.auth.totp import PERIOD, TOTPLockedOut, TOTPProvider, hotp
+from src.config import settings
+
+
+@pytest.fixture
+def store_path(monkeypatch, tmp_path):
+    path = str(tmp_path / "totp.db")
+    monkeypatch.setattr(settings, "TOTP_STORE_PATH", path)
+    return path
+
+
+def _secret(enrollment) -> bytes:
+    encoded = enrollment["secret"]
+    return base64.b32decode(encoded + "=" * (-len(encoded) % 8))
+
+
+def _code(secret: bytes, steps_ahead: int = 0) -> str:
+    return hotp(secret, int(time.time()) // PERIOD + steps_ahead)
+
+
+def test_confirm_code_cannot_be_replayed(store_path):
+    totp = TOTPProvider()
+    secret = _secret(totp.enroll("a@comma.cm"))
+    code = _code(secret)
+
+    assert totp.confirm("a@comma.cm", code)
+    assert not totp.verify("a@comma.cm", code)
+
+
+def test_code_is_accepted_once_across_workers(store_path):
+    worker_a, worker_b = TOTPProvider(), TOTPProvider()
+    secret = _secret(worker_a.enroll("a@comma.cm"))
+    assert worker_a.confirm("a@comma.cm", _code(secret))
+
+    # One step ahead is inside the drift window and newer than the confirmed step
+    code = _code(secret, steps_ahead=1)
+    assert worker_a.verify("a@comma.cm", code)
+    assert not worker_a.verify("a@comma.cm", code)
+    assert not worker_b.verify("a@comma.cm", code)
+
+
+def test_older_step_is_rejected_after_a_newer_one(store_path):
+    totp = TOTPProvider()
+    secret = _secret(totp.enroll("a@comma.cm"))
+    assert totp.confirm("a@comma.cm", _code(secret, steps_ahead=1))
+    assert not totp.verify("a@comma.cm", _code(secret))
+
+
+def test_disabled_without_encryption_key(store_path, monkeypatch):
+    monkeypatch.setattr(settings, "TOTP_ENCRYPTION_KEY", "")
+    assert not TOTPProvider().enabled
+
+
+class _Events:
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, event_type, **fields):
+        self.emitted.append((event_type, fields))
+
+
+def _wrong(code: str) -> str:
+    return str((int(code) + 1) % 10 ** 6).zfill(6)
+
+
+def test_lockout_after_failed_attempts(store_path, monkeypatch):
+    monkeypatch.setattr(settings, "TOTP_MAX_FAILED_ATTEMPTS", 3)
+    events = _Events()
+    totp = TOTPProvider(event_log=events)
+    secret = _secret(totp.enroll("a@comma.cm"))
+    assert totp.confirm("a@comma.cm", _code(secret))
+
+    code = _code(secret, steps_ahead=1)
+    assert not totp.verify("a@comma.cm", _wrong(code))
+    assert not totp.verify("a@comma.cm", "abc")
+    with pytest.raises(TOTPLockedOut):
+        totp.verify("a@comma.cm", _wrong(code))
+    assert events.emitted == [("totp_lockout", {"sub": "a@comma.cm", "failed_attempts": 3})]
+
+    # Even the right code is refused while locked, by every worker
+    with pytest.raises(TOTPLockedOut):
+        totp.verify("a@comma.cm", code)
+    with pytest.raises(TOTPLockedOut):
+        TOTPProvider().verify("a@comma.cm", code)
+
+
+def test_lockout_expires_and_success_resets_the_count(store_path, monkeypatch):
+    monkeypatch.setattr(settings, "TOTP_MAX_FAILED_ATTEMPTS", 2)
+    monkeypatch.setattr(settings, "TOTP_LOCKOUT_SECONDS", 0.2)
+    totp = TOTPProvider()
+    secret = _secret(totp.enroll("a@comma.cm"))
+    code = _code(secret)
+
+    assert not totp.confirm("a@comma.cm", _wrong(code))
+    with pytest.raises(TOTPLockedOut):
+        totp.confirm("a@comma.cm", _wrong(code))
+    time.sleep(0.25)
+    assert totp.confirm("a@comma.cm", code)
+
+    # The count restarted after the lockout and again after the success
+    assert not totp.verify("a@comma.cm", _wrong(code))
+    assert totp.verify("a@comma.cm", _code(secret, steps_ahead=1))
+    assert not totp.verify("a@comma.cm", _wrong(code))
+
+
+def test_unconfirmed_re_enrollment_keeps_the_current_authenticator(store_path):
+    totp = TOTPProvider()
+    old = _secret(totp.enroll("a@comma.cm"))
+    assert totp.confirm("a@comma.cm", _code(old))
+
+    new = _secret(totp.enroll("a@comma.cm"))
+    assert totp.is_enrolled("a@comma.cm")
+    assert totp.verify("a@comma.cm", _code(old, steps_ahead=1))
+
+    assert totp.confirm("a@comma.cm", _code(new))
+    assert not totp.verify("a@comma.cm", _code(old, steps_ahead=1))
+    assert not totp.confirm("a@comma.cm", _code(new))  # nothing pending any more
+
+
+def test_pending_enrollment_from_an_older_store_is_migrated(store_path):
+    totp = TOTPProvider()
+    secret = _secret(totp.enroll("a@comma.cm"))
+    encrypted = totp.conn.execute("SELECT pending_secret FROM totp").fetchone()[0]
+    totp.conn.execute("DROP TABLE totp")
+    totp.conn.execute(
+        "CREATE TABLE totp (email TEXT PRIMARY KEY, secret BLOB NOT NULL, confirmed INTEGER NOT NULL DEFAULT 0,"
+        " last_step INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL)"
+    )
+    totp.conn.execute("INSERT INTO totp VALUES ('a@comma.cm', ?, 0, 0, 0)", (encrypted,))
+
+    migrated = TOTPProvider()
+    assert not migrated.is_enrolled("a@comma.cm")
+    assert migrated.confirm("a@comma.cm", _code(secret))
+    assert migrated.is_enrolled("a@comma.cm")